@@ -2,92 +2,210 @@ from flask import Flask, render_template, request, redirect, url_for, flash, ses
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import json
 from datetime import datetime
 import uuid
 import socket
+import click
+from jinja2 import FileSystemBytecodeCache
 
 # Import models
-from models import db, User, Category, Product, Order, OrderItem
+from models import db, User, Category, Product, ProductVariant, Order, OrderItem, MonthlyRevenue
+from services.search import ensure_search_index, rebuild_search_index
+from services.catalog import get_categories, get_featured_products
+from services.page_cache import cache_page
+from services.rollups import rebuild_rollups
+from services.recommendations import rebuild_recommendations
+from services.orders import order_detail_options
+from services.variants import migrate_json_variants
+from services import migrations
+from services.metrics import install_timing_listeners, metrics_view, record_request, start_request_timer
+from services.database import engine_config, install_sqlite_pragmas, read_only, route_read_only_requests
+from services.images import image_size, add_image_cache_headers
+from services.assets import asset_urls, build_assets, fingerprint_static_url, send_asset
+from services.auth import load_user
+from services.cart import prune_anonymous_carts
+from services.warmup import compile_templates
+from services import jobs
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'zeecloths-secret-key-2024'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///zeecloths.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'static/images/products'
-app.config['PERMANENT_SESSION_LIFETIME'] = 1800  # 30 minutes
-
-# Initialize extensions
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'user.login'
+# Served from the user cache; see services/auth.py
+login_manager.user_loader(load_user)
+
+def create_app(config=None):
+    """Build the app from the defaults below, ZEECLOTHS_* environment variables and `config`"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'zeecloths-secret-key-2024')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///zeecloths.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'static/images/products')
+    app.config['PERMANENT_SESSION_LIFETIME'] = 1800  # 30 minutes
+    app.config['CATALOG_CACHE_TTL'] = 300  # seconds
+    app.config['CATALOG_CACHE_SIZE'] = 512  # entries
+    app.config['PAGE_CACHE_TTL'] = 600  # seconds
+    app.config['PAGE_CACHE_SIZE'] = 256  # entries
+    app.config['PAGE_CACHE_SKIP_AUTHENTICATED'] = True
+    # Catalog version shared by every server and job worker process; '' keeps it per process
+    app.config['CATALOG_VERSION_FILE'] = os.path.join(app.instance_path, 'catalog_version')
+    app.config['PAGINATION_EXACT_TOTALS'] = False  # keyset pages skip COUNT(*) unless set
+    app.config['STATS_CACHE_TTL'] = 30  # seconds
+    app.config['ASSET_FINGERPRINTING'] = True  # serve static/dist/ copies once `flask build-assets` has run
+    # SQLite engine profile (file databases only, see services/database.py)
+    app.config['SQLITE_JOURNAL_MODE'] = 'WAL'  # readers never block behind a writer
+    app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'  # durable enough with WAL, far fewer fsyncs
+    app.config['SQLITE_CACHE_SIZE'] = -16000  # KiB of page cache per connection
+    app.config['SQLITE_MMAP_SIZE'] = 134217728  # bytes
+    app.config['SQLITE_BUSY_TIMEOUT'] = 5000  # ms to wait for a lock instead of "database is locked"
+    app.config['DB_WRITER_POOL_SIZE'] = 8  # connections for routes and jobs that may write; writes still run one at a time
+    app.config['DB_WRITER_MAX_OVERFLOW'] = 4
+    app.config['DB_READER_POOL_SIZE'] = 8
+    app.config['DB_READ_ONLY_ROUTING'] = True  # storefront GETs read from a query_only pool
+    app.config['METRICS_ENABLED'] = True  # Server-Timing header and /metrics histograms
+    app.config['METRICS_ALLOW_LOCALHOST'] = False  # /metrics without login from 127.0.0.1 (never behind a local proxy)
+    app.config['METRICS_DIR'] = os.path.join(app.instance_path, 'metrics')  # per-process totals /metrics adds up; '' for this process only
+    app.config['METRICS_FLUSH_INTERVAL'] = 1.0  # seconds between writes of a process's totals
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'  # full method string; older hashes are upgraded on login
+    app.config['PASSWORD_HASH_CONCURRENCY'] = 4  # password hashes computed at once
+    app.config['PASSWORD_HASH_WAIT'] = 2  # seconds to wait for a hashing slot before answering 503
+    app.config['LOGIN_THROTTLE_ENABLED'] = True
+    app.config['LOGIN_IP_BURST'] = 10  # login attempts per client IP...
+    app.config['LOGIN_IP_PER_MINUTE'] = 10  # ...refilled at this rate
+    app.config['LOGIN_ACCOUNT_BURST'] = 5  # login attempts per username/email...
+    app.config['LOGIN_ACCOUNT_PER_MINUTE'] = 2  # ...refilled at this rate
+    app.config['REGISTER_IP_BURST'] = 5  # registrations per client IP...
+    app.config['REGISTER_IP_PER_MINUTE'] = 1  # ...refilled at this rate
+    app.config['PROXY_FIX_X_FOR'] = 0  # reverse proxies in front of the app whose X-Forwarded-For is trusted
+    app.config['USER_CACHE_TTL'] = 60  # seconds a logged-in user's row is reused without a query
+    app.config['USER_CACHE_SIZE'] = 1024  # entries
+    app.config['API_CACHE_TTL'] = 300  # seconds; /api/v1 catalog payloads also expire on any catalog change
+    app.config['API_CACHE_SIZE'] = 512  # entries
+    app.config['API_GZIP_MIN_SIZE'] = 1024  # bytes; smaller JSON bodies are sent uncompressed
+    app.config['RECOMMENDATIONS_TOP_K'] = 10  # frequently-bought-together products kept per product
+    app.config['JOBS_WORKERS'] = 2  # background job threads per server process; 0 to leave jobs to `flask jobs-worker`
+    app.config['JOBS_POLL_INTERVAL'] = 1.0  # seconds an idle worker waits before looking again
+    app.config['JOBS_VISIBILITY_TIMEOUT'] = 300  # seconds before a claimed job that never finished runs again
+    app.config['JOBS_MAX_ATTEMPTS'] = 5
+    app.config['JOBS_BACKOFF_BASE'] = 10  # seconds before the first retry, doubling per attempt...
+    app.config['JOBS_BACKOFF_MAX'] = 3600  # ...up to this
+    app.config['DB_UPGRADE_ON_START'] = True  # wsgi.py applies pending migrations before serving
+    app.config['WARM_UP'] = True  # wsgi.py compiles templates and primes caches before serving
+    app.config['WARM_UP_URLS'] = ['/', '/shop']  # pages rendered (and page-cached) during warm-up
+    app.config['JINJA_BYTECODE_CACHE_DIR'] = os.path.join(app.instance_path, 'jinja_cache')  # '' to disable
+    # Every setting can be overridden from the environment, e.g. ZEECLOTHS_DB_READER_POOL_SIZE=16
+    # (values are parsed as JSON, so ZEECLOTHS_WARM_UP=false is a boolean)
+    app.config.from_prefixed_env('ZEECLOTHS')
+    app.config.update(config or {})
+    app.config.update(engine_config(app.config))
+
+    # Behind a proxy the client IP (throttles, /metrics) comes from X-Forwarded-For
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'],
+                                x_proto=app.config['PROXY_FIX_X_FOR'])
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    # Initialize extensions
+    db.init_app(app)
+    install_sqlite_pragmas(app, db)
 
-# Import and register blueprints
-from routes.user_routes import user_bp
-from routes.shop_routes import shop_bp
-from routes.admin_routes import admin_bp
+    # Request timing for every route: registered first so it also times the other hooks
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+    install_timing_listeners(app, db)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
 
-app.register_blueprint(user_bp)
-app.register_blueprint(shop_bp)
-app.register_blueprint(admin_bp)
+    app.before_request(route_read_only_requests)
+    login_manager.init_app(app)
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Main routes
-@app.route('/')
-def index():
-    categories = Category.query.all()
-    featured_products = Product.query.limit(8).all()
-    return render_template('index.html', categories=categories, featured_products=featured_products)
+    # Sized product images: {{ product.image_url|image_size('card') }}
+    app.add_template_filter(image_size)
+    app.after_request(add_image_cache_headers)
 
-@app.route('/about')
-def about():
-    return render_template('about.html')
+    # Fingerprinted, precompressed static assets: url_for('static', ...) picks up built copies
+    app.url_defaults(fingerprint_static_url)
+    app.add_url_rule('/static/dist/<path:filename>', 'asset', send_asset)
+    app.add_template_global(asset_urls)
 
-@app.route('/contact')
-def contact():
-    return render_template('contact.html')
+    # Compiled templates survive restarts, so a fresh worker skips the Jinja compiler
+    if app.config['JINJA_BYTECODE_CACHE_DIR']:
+        os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
 
+    # Import and register blueprints
+    from routes.user_routes import user_bp
+    from routes.shop_routes import shop_bp
+    from routes.admin_routes import admin_bp
+    from routes.order_routes import order_bp
+    from routes.api_routes import api_bp
 
+    app.register_blueprint(user_bp)
+    app.register_blueprint(shop_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(order_bp)
+    app.register_blueprint(api_bp)
 
-@app.route('/debug/products')
-def debug_products():
-    products = Product.query.all()
-    product_list = []
-    for product in products:
-        product_list.append({
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'stock': product.stock,
-            'image_url': product.image_url
-        })
-    return jsonify({'products': product_list})
+    _register_main_routes(app)
+    _register_commands(app)
+    return app
 
+def _register_main_routes(app):
+    """Home, info and order confirmation pages"""
+    @app.route('/')
+    @read_only
+    @cache_page
+    def index():
+        categories = get_categories()
+        featured_products = get_featured_products()
+        return render_template('index.html', categories=categories, featured_products=featured_products)
 
+    @app.route('/about')
+    def about():
+        return render_template('about.html')
 
+    @app.route('/contact')
+    def contact():
+        return render_template('contact.html')
 
+    @app.route('/debug/products')
+    def debug_products():
+        products = Product.query.all()
+        product_list = []
+        for product in products:
+            product_list.append({
+                'id': product.id,
+                'name': product.name,
+                'price': product.price,
+                'stock': product.stock,
+                'image_url': product.image_url
+            })
+        return jsonify({'products': product_list})
 
-@app.route('/order_confirmation/<int:order_id>')
-@login_required
-def order_confirmation(order_id):
-    order = Order.query.get_or_404(order_id)
-    if order.user_id != current_user.id and not current_user.is_admin:
-        flash('Access denied', 'error')
-        return redirect(url_for('index'))
-    return render_template('order_confirmation.html', order=order)
+    @app.route('/order_confirmation/<int:order_id>')
+    @login_required
+    def order_confirmation(order_id):
+        order = Order.query.options(*order_detail_options()).get_or_404(order_id)
+        if order.user_id != current_user.id and not current_user.is_admin:
+            flash('Access denied', 'error')
+            return redirect(url_for('index'))
+        return render_template('order_confirmation.html', order=order)
 
-# Initialize database and sample data
-def init_db():
+def upgrade_db(app):
+    """Create missing tables, apply pending migrations and set up the search index"""
     with app.app_context():
         db.create_all()
+        migrations.upgrade()
+        ensure_search_index()
         
+        # Backfill the revenue rollups the first time they are created
+        if MonthlyRevenue.query.first() is None and Order.query.first() is not None:
+            rebuild_rollups()
+
+def seed_db(app):
+    """Add the sample categories, products and the admin and normal users where missing"""
+    with app.app_context():
         # Check if categories exist
         if Category.query.count() == 0:
             categories = [
@@ -110,6 +228,10 @@ def init_db():
             db.session.add_all(products)
             db.session.commit()
         
+        # Build size/color variants for products that only have the legacy JSON columns
+        if ProductVariant.query.first() is None and Product.query.first() is not None:
+            migrate_json_variants()
+        
         # Create admin user if not exists
         if User.query.filter_by(email='admin@zeecloths.com').first() is None:
             admin_user = User(
@@ -136,6 +258,100 @@ def init_db():
             db.session.add(normal_user)
             db.session.commit()
 
+def init_db(app):
+    """Schema and sample data, as used by `flask seed`, reset_db.py and the checks"""
+    upgrade_db(app)
+    seed_db(app)
+
+def _register_commands(app):
+    """`flask --app app <command>` maintenance commands"""
+    @app.cli.command('seed')
+    def seed_command():
+        """Create the tables and add the sample catalog and users if missing"""
+        init_db(app)
+        print("Sample data is in place")
+
+    @app.cli.command('warm-up')
+    def warm_up_command():
+        """Compile every template into the Jinja bytecode cache"""
+        count = compile_templates(app)
+        print(f"Compiled {count} templates")
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the product full-text search index"""
+        ensure_search_index()
+        count = rebuild_search_index()
+        print(f"Indexed {count} products")
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Rebuild the daily and monthly revenue rollup tables"""
+        rebuild_rollups()
+        print("Revenue rollups rebuilt")
+
+    @app.cli.command('build-recommendations')
+    def build_recommendations_command():
+        """Rebuild the frequently-bought-together tables from the order history"""
+        count = rebuild_recommendations()
+        print(f"Recommendations built for {count} products")
+
+    @app.cli.command('migrate-variants')
+    def migrate_variants_command():
+        """Create product variants from the legacy sizes/colors JSON columns"""
+        count = migrate_json_variants()
+        print(f"Created variants for {count} products")
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Bundle, minify, fingerprint and precompress static assets into static/dist"""
+        manifest = build_assets(app.static_folder, os.path.join(app.root_path, app.config['UPLOAD_FOLDER']))
+        print(f"Built {len(manifest)} assets into static/dist")
+
+    @app.cli.command('jobs-worker')
+    @click.option('--threads', default=2, show_default=True, help='Jobs run at once')
+    def jobs_worker_command(threads):
+        """Run background jobs until interrupted"""
+        print(f"Job worker running with {threads} threads (Ctrl+C to stop)")
+        jobs.serve(app, threads)
+
+    @app.cli.command('jobs-status')
+    def jobs_status_command():
+        """Show queued and failed background jobs"""
+        counts = jobs.job_counts()
+        print(f"queued: {counts.get('queued', 0)}  failed: {counts.get('failed', 0)}")
+        for job in jobs.failed_jobs():
+            print(f"{job.id:>6}  {job.name:<24} {job.attempts} attempts  {job.last_error}")
+
+    @app.cli.command('jobs-retry')
+    def jobs_retry_command():
+        """Queue every failed background job again"""
+        count = jobs.retry_failed()
+        print(f"Requeued {count} jobs")
+
+    @app.cli.command('prune-carts')
+    @click.option('--days', default=30, show_default=True, help='Age of the anonymous carts to delete')
+    def prune_carts_command(days):
+        """Delete anonymous carts nobody has touched for a while"""
+        count = prune_anonymous_carts(days)
+        print(f"Deleted {count} anonymous carts")
+
+    @app.cli.command('db-upgrade')
+    def db_upgrade_command():
+        """Apply pending schema migrations to the configured database"""
+        db.create_all()
+        applied = migrations.upgrade()
+        for version, description in applied:
+            print(f"Applied migration {version}: {description}")
+        print(f"Database is at version {max(migrations.applied_versions(), default=0)}")
+
+    @app.cli.command('db-status')
+    def db_status_command():
+        """List schema migrations and whether they have been applied"""
+        applied = migrations.applied_versions()
+        for version, description, _ in migrations.MIGRATIONS:
+            print(f"{'applied' if version in applied else 'pending':<8} {version:>3}  {description}")
+
 def get_local_ip():
     """Get the local IP address of the machine"""
     try:
@@ -148,7 +364,12 @@ def get_local_ip():
         return "127.0.0.1"
 
 if __name__ == '__main__':
-    init_db()
+    # Development server; production runs wsgi.py under gunicorn (see gunicorn.conf.py)
+    app = create_app()
+    upgrade_db(app)
+    # Only the reloader's child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        jobs.start_workers(app)
     local_ip = get_local_ip()
     print("=" * 60)
     print("🚀 ZEECLOTHS E-commerce Application Starting...")
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for ZEECLOTHS
+Generates a synthetic catalog (products, variants, users, orders and order
+items) in a separate SQLite database, then drives the key routes through the
+Flask test client and reports p50/p95/p99 latency, throughput and SQL
+statements per request. Results can be saved as a baseline and later runs
+compared against it; the script exits with status 1 on a regression.
+
+    python benchmark.py                       # small dataset, compare to baseline if present
+    python benchmark.py --scale full          # 100k products, 50k users, 1M orders
+    python benchmark.py --save-baseline       # store this run as the new baseline
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+SCALES = {
+    # name: (products, users, orders)
+    'small': (10000, 5000, 50000),
+    'medium': (50000, 20000, 250000),
+    'full': (100000, 50000, 1000000),
+}
+
+SIZES = ['S', 'M', 'L', 'XL']
+COLORS = ['Black', 'White', 'Blue', 'Gray', 'Navy', 'Red']
+ADJECTIVES = ['Classic', 'Slim Fit', 'Relaxed', 'Premium', 'Vintage', 'Oversized', 'Essential', 'Cropped']
+GARMENTS = {1: 'Shirt', 2: 'T-Shirt', 3: 'Jeans', 4: 'Hoodie'}
+STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'delivered', 'delivered', 'cancelled']
+
+BATCH_SIZE = 10000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate a synthetic catalog and benchmark the key routes')
+    parser.add_argument('--scale', choices=SCALES, default='small', help='dataset size preset')
+    parser.add_argument('--products', type=int, help='override the number of products')
+    parser.add_argument('--users', type=int, help='override the number of users')
+    parser.add_argument('--orders', type=int, help='override the number of orders')
+    parser.add_argument('--db', default='instance/benchmark.db', help='SQLite file for the synthetic data')
+    parser.add_argument('--regenerate', action='store_true', help='rebuild the dataset even if the file exists')
+    parser.add_argument('--requests', type=int, default=50, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=3, help='unmeasured requests per route')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads per route')
+    parser.add_argument('--no-cache', action='store_true', help='disable the page and catalog caches')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='baseline file to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='write this run to the baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown vs. baseline (0.25 = 25%%)')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+args = parse_args()
+products_count, users_count, orders_count = SCALES[args.scale]
+products_count = args.products or products_count
+users_count = args.users or users_count
+orders_count = args.orders or orders_count
+
+# Never touch the real database
+os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+
+from sqlalchemy import event, insert, text
+from werkzeug.security import generate_password_hash
+from app import create_app, init_db
+from models import db, User, Product, ProductVariant, Order, OrderItem
+from services.recommendations import rebuild_recommendations
+from services.rollups import rebuild_rollups
+from services.search import rebuild_search_index
+
+# Background job threads would add their polling to the statement counts
+app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.abspath(args.db)}", 'JOBS_WORKERS': 0})
+
+ROUTES = [
+    # (name, login as, url or callable(rng, product_ids) -> url)
+    ('home', None, '/'),
+    ('shop', None, '/shop'),
+    ('shop price sort', None, '/shop?sort=price_low'),
+    ('shop category + price', None, '/shop?category=2&min_price=500&max_price=1500&sort=price_high'),
+    ('shop size/color', None, '/shop?size=M&color=Black'),
+    ('search', None, '/search?q=slim'),
+    ('product detail', None, lambda rng, ids: f"/product/{rng.choice(ids)}"),
+    ('admin dashboard', 'admin', '/admin/'),
+    ('admin analytics', 'admin', '/admin/analytics'),
+    ('admin orders', 'admin', '/admin/orders'),
+    ('admin orders by status', 'admin', '/admin/orders?status=pending'),
+]
+
+def _insert_batches(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+    db.session.commit()
+
+def generate_dataset(rng):
+    """Bulk-insert the synthetic catalog; returns the number of order items"""
+    now = datetime.utcnow()
+    start = now - timedelta(days=730)
+
+    def products():
+        for i in range(products_count):
+            category_id = rng.randint(1, 4)
+            yield {
+                'name': f"{rng.choice(ADJECTIVES)} {rng.choice(COLORS)} {GARMENTS[category_id]} {i}",
+                'description': f"Synthetic benchmark product {i}",
+                'price': float(rng.randrange(299, 4999, 10)),
+                'stock': 0,
+                'image_url': '/static/images/products/default.jpg',
+                'sizes': json.dumps(SIZES),
+                'colors': json.dumps(COLORS[:2]),
+                'category_id': category_id,
+                'created_at': start + timedelta(seconds=rng.randint(0, 730 * 86400))
+            }
+
+    def variants():
+        for product_id in range(first_product_id, first_product_id + products_count):
+            for size in SIZES:
+                for color in COLORS[:2]:
+                    yield {'product_id': product_id, 'size': size, 'color': color, 'stock': rng.randint(0, 20)}
+
+    # Hashing is slow; every synthetic user shares one password
+    password_hash = generate_password_hash('bench123')
+
+    def users():
+        for i in range(users_count):
+            yield {
+                'username': f"bench{i}",
+                'email': f"bench{i}@example.com",
+                'password_hash': password_hash,
+                'first_name': 'Bench',
+                'last_name': f"User{i}",
+                'is_admin': False,
+                'created_at': start
+            }
+
+    print(f"   products: {products_count}")
+    first_product_id = (db.session.execute(text('SELECT coalesce(max(id), 0) FROM product')).scalar()) + 1
+    _insert_batches(Product, products())
+    _insert_batches(ProductVariant, variants())
+    db.session.execute(text(
+        'UPDATE product SET stock = (SELECT coalesce(sum(stock), 0) FROM product_variant '
+        'WHERE product_variant.product_id = product.id) WHERE id >= :first'
+    ), {'first': first_product_id})
+    db.session.commit()
+
+    print(f"   users: {users_count}")
+    first_user_id = (db.session.execute(text('SELECT coalesce(max(id), 0) FROM user')).scalar()) + 1
+    _insert_batches(User, users())
+
+    print(f"   orders: {orders_count}")
+    first_order_id = (db.session.execute(text('SELECT coalesce(max(id), 0) FROM "order"')).scalar()) + 1
+    product_ids = range(first_product_id, first_product_id + products_count)
+    order_batch, item_batch, items_total = [], [], 0
+    for i in range(orders_count):
+        order_id = first_order_id + i
+        created_at = start + timedelta(seconds=rng.randint(0, 730 * 86400))
+        total = 0.0
+        for _ in range(rng.randint(1, 4)):
+            price = float(rng.randrange(299, 4999, 10))
+            quantity = rng.randint(1, 3)
+            total += price * quantity
+            item_batch.append({
+                'order_id': order_id, 'product_id': rng.choice(product_ids), 'quantity': quantity,
+                'price': price, 'size': rng.choice(SIZES), 'color': rng.choice(COLORS[:2])
+            })
+        order_batch.append({
+            'id': order_id, 'order_number': f"BENCH{order_id:010d}",
+            'user_id': rng.randint(first_user_id, first_user_id + users_count - 1),
+            'total_amount': round(total, 2), 'status': rng.choice(STATUSES), 'payment_method': 'cod',
+            'shipping_address': 'Synthetic address', 'billing_address': 'Synthetic address',
+            'created_at': created_at
+        })
+        if len(order_batch) >= BATCH_SIZE:
+            db.session.execute(insert(Order), order_batch)
+            db.session.execute(insert(OrderItem), item_batch)
+            db.session.commit()
+            items_total += len(item_batch)
+            order_batch, item_batch = [], []
+    if order_batch:
+        db.session.execute(insert(Order), order_batch)
+        db.session.execute(insert(OrderItem), item_batch)
+        db.session.commit()
+        items_total += len(item_batch)
+
+    print("   rebuilding rollups, recommendations and search index")
+    rebuild_rollups()
+    rebuild_recommendations()
+    rebuild_search_index()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+    return items_total
+
+def prepare_database(rng):
+    if args.regenerate and os.path.exists(args.db):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    fresh = not os.path.exists(args.db)
+    init_db(app)
+    with app.app_context():
+        if fresh:
+            print(f"📦 Generating synthetic dataset in {args.db}")
+            started = time.perf_counter()
+            items = generate_dataset(rng)
+            print(f"   {items} order items, {time.perf_counter() - started:.1f}s")
+        else:
+            print(f"📦 Reusing {args.db} (pass --regenerate to rebuild)")
+        counts = {
+            'products': Product.query.count(),
+            'users': User.query.count(),
+            'orders': Order.query.count()
+        }
+        product_ids = [row[0] for row in db.session.query(Product.id).order_by(db.func.random()).limit(500)]
+    return counts, product_ids
+
+class StatementCounter:
+    """Counts statements executed on every engine of the app"""
+
+    def __init__(self):
+        self.count = 0
+
+    def _record(self, *args):
+        self.count += 1
+
+    def install(self):
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._record)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+def logged_in_client(login_as):
+    client = app.test_client()
+    if login_as == 'admin':
+        client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    return client
+
+def run_route(name, login_as, url, rng, product_ids, counter):
+    def next_url():
+        return url(rng, product_ids) if callable(url) else url
+
+    def worker(requests):
+        client = logged_in_client(login_as)
+        timings = []
+        for _ in range(requests):
+            target = next_url()
+            started = time.perf_counter()
+            response = client.get(target)
+            timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f"{target} returned HTTP {response.status_code}")
+        return timings
+
+    worker(args.warmup)
+    statements_before = counter.count
+    started = time.perf_counter()
+    per_thread = max(1, args.requests // args.concurrency)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        timings = [t for result in pool.map(worker, [per_thread] * args.concurrency) for t in result]
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+        'mean_ms': round(statistics.mean(timings) * 1000, 2),
+        'throughput_rps': round(len(timings) / elapsed, 1),
+        'statements': round((counter.count - statements_before) / len(timings), 1)
+    }
+
+def compare(results, baseline):
+    """Routes whose p95 or statement count regressed past the baseline"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('routes', {}).get(name)
+        if not before:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + args.tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        # Averages wobble slightly with cache hits; a real N+1 adds whole statements
+        if result['statements'] > before['statements'] + 0.5:
+            regressions.append(f"{name}: statements {before['statements']} -> {result['statements']}")
+    return regressions
+
+if __name__ == '__main__':
+    print("⏱️  ZEECLOTHS Benchmark")
+    print("=" * 96)
+    rng = random.Random(args.seed)
+    # Every simulated admin client logs in from the same address
+    app.config['LOGIN_THROTTLE_ENABLED'] = False
+    if args.no_cache:
+        app.config['PAGE_CACHE_ENABLED'] = False
+        app.config['CATALOG_CACHE_ENABLED'] = False
+    dataset, product_ids = prepare_database(rng)
+    print(f"   dataset: {dataset}")
+    counter = StatementCounter()
+    counter.install()
+
+    print("=" * 96)
+    print(f"{'route':<26}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'req/s':>10}{'SQL/req':>10}")
+    results = {}
+    for name, login_as, url in ROUTES:
+        result = run_route(name, login_as, url, rng, product_ids, counter)
+        results[name] = result
+        print(f"{name:<26}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+              f"{result['mean_ms']:>10}{result['throughput_rps']:>10}{result['statements']:>10}")
+    print("=" * 96)
+
+    run = {
+        'dataset': dataset,
+        'settings': {'requests': args.requests, 'concurrency': args.concurrency, 'cache': not args.no_cache},
+        'created_at': datetime.utcnow().isoformat(),
+        'routes': results
+    }
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️  No baseline at {args.baseline}; run with --save-baseline to create one")
+        sys.exit(0)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('dataset') != dataset or baseline.get('settings') != run['settings']:
+        print("⚠️  Baseline was recorded with a different dataset or settings; comparison may be noisy")
+    regressions = compare(results, baseline)
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) against {args.baseline}:")
+        for regression in regressions:
+            print(f"   {regression}")
+        sys.exit(1)
+    print(f"🎉 No regressions against {args.baseline}")
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Query Budget Check for ZEECLOTHS
+Renders each route against a seeded in-memory database and counts the SQL
+statements it issues. Exits with status 1 if any route goes over its budget,
+so N+1 query patterns are caught before they ship.
+"""
+
+import sys
+
+from sqlalchemy import event
+from app import create_app, init_db
+from models import db, User, Product, Order, OrderItem, Cart, CartItem
+
+# Never touch the real database; counts are for uncached renders
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'PAGE_CACHE_ENABLED': False,
+    'CATALOG_CACHE_ENABLED': False
+})
+
+# Maximum SQL statements per request. Budgets must not depend on how many
+# rows a page shows, so the seed data below has several orders and items.
+ROUTE_BUDGETS = [
+    # (login as, url, budget)
+    (None, '/', 3),
+    # The shop adds one UNION ALL statement for all of its facet counts
+    (None, '/shop', 4),
+    (None, '/shop?sort=price_low', 4),
+    (None, '/shop?size=M&color=Black&min_price=500', 4),
+    (None, '/search?q=shirt', 4),
+    (None, '/category/1', 3),
+    # Recommendations: one neighbor-list lookup, the recommended products and a same-category
+    # top-up (the seed catalog is too small to fill four recommendations from orders alone)
+    (None, '/product/1', 5),
+    ('user', '/profile', 4),
+    ('user', '/order/1', 4),
+    ('user', '/order_confirmation/1', 4),
+    # Cart, its items and one IN (...) validation query, however many lines it has
+    ('user', '/api/v1/cart', 3),
+    ('admin', '/admin/', 5),
+    ('admin', '/admin/products', 3),
+    ('admin', '/admin/orders', 3),
+    ('admin', '/admin/orders/1', 4),
+    ('admin', '/admin/users', 4),
+    ('admin', '/admin/categories', 4),
+    ('admin', '/admin/analytics', 4),
+]
+
+class StatementCounter:
+    """Counts statements executed on the engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+def seed_orders():
+    """Give the normal user several multi-item orders and a filled cart"""
+    user = User.query.filter_by(username='user').first()
+    products = Product.query.all()
+    for i in range(6):
+        order = Order(user_id=user.id, total_amount=0, payment_method='cod',
+                      shipping_address='221B Baker Street')
+        db.session.add(order)
+        db.session.flush()
+        for product in products:
+            db.session.add(OrderItem(order_id=order.id, product_id=product.id,
+                                     quantity=1, price=product.price, size='M', color='Black'))
+            order.total_amount += product.price
+    cart = Cart(user_id=user.id)
+    cart.items = [CartItem(product_id=product.id, quantity=2, size='M', color='Black', added_price=product.price)
+                  for product in products]
+    db.session.add(cart)
+    db.session.commit()
+
+def check_budgets(verbose=False):
+    init_db(app)
+    with app.app_context():
+        seed_orders()
+        from services.rollups import rebuild_rollups
+        from services.recommendations import rebuild_recommendations
+        rebuild_rollups()
+        rebuild_recommendations()
+        engine = db.engine
+
+    credentials = {'user': 'user123', 'admin': 'admin123'}
+    clients = {None: app.test_client()}
+    for username, password in credentials.items():
+        clients[username] = app.test_client()
+        clients[username].post('/login', data={'username': username, 'password': password})
+
+    failures = []
+    for login_as, url, budget in ROUTE_BUDGETS:
+        with StatementCounter(engine) as counter:
+            response = clients[login_as].get(url)
+        used = len(counter.statements)
+        ok = response.status_code == 200 and used <= budget
+        print(f"{'✅' if ok else '❌'} {url:<28} {used:>3} / {budget:<3} queries  (HTTP {response.status_code})")
+        if not ok:
+            failures.append(url)
+            if verbose:
+                for statement in counter.statements:
+                    print(f"      {' '.join(statement.split())[:120]}")
+    return failures
+
+if __name__ == '__main__':
+    print("🔎 ZEECLOTHS Query Budget Check")
+    print("=" * 60)
+    failures = check_budgets(verbose='-v' in sys.argv)
+    print("=" * 60)
+    if failures:
+        print(f"❌ {len(failures)} route(s) over budget: {', '.join(failures)}")
+        sys.exit(1)
+    print("🎉 All routes within their query budgets")
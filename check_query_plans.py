@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Query Plan Check for ZEECLOTHS
+Renders the hot routes against a seeded in-memory database, runs
+EXPLAIN QUERY PLAN on every SELECT they issue and exits with status 1 if any
+of them falls back to a full table scan of a table that grows with traffic.
+A whole-index scan counts as a full scan too; the few statements that are
+allowed to scan are listed in ALLOWED_SCANS, each with the reason.
+"""
+
+import re
+import sys
+
+# Shares the in-memory database setup with the query budget check
+from check_query_budgets import StatementCounter, app, seed_orders
+from app import init_db
+from models import db
+
+# Lookup tables small enough that scanning them is the right plan
+SMALL_TABLES = {'category', 'daily_revenue', 'monthly_revenue', 'schema_version'}
+
+HOT_ROUTES = [
+    # (login as, url)
+    (None, '/shop?category=1'),
+    (None, '/shop?sort=price_low'),
+    (None, '/shop?sort=price_high&min_price=500&max_price=1500'),
+    (None, '/shop?category=2&sort=price_low'),
+    (None, '/shop?sort=name'),
+    (None, '/shop?size=M&color=Black'),
+    (None, '/shop?search=shirt&size=M&min_price=500&max_price=999.99'),
+    (None, '/search?q=shirt'),
+    (None, '/category/1'),
+    (None, '/product/1'),
+    ('user', '/profile'),
+    ('user', '/order/1'),
+    ('user', '/api/v1/cart'),
+    ('admin', '/admin/'),
+    ('admin', '/admin/orders'),
+    ('admin', '/admin/orders?status=pending'),
+    ('admin', '/admin/orders/1'),
+    ('admin', '/admin/users'),
+    ('admin', '/admin/categories'),
+]
+
+_FACETS = r'^SELECT \? AS facet, '
+_DASHBOARD_TOTALS = r'^SELECT \(SELECT count\(product\.id\) AS count_1 FROM product\) AS anon_1, '
+
+# (statement pattern, plan step, why that scan is acceptable). Keyset pages only qualify
+# without a WHERE clause: the pattern runs from FROM straight to ORDER BY ... LIMIT.
+ALLOWED_SCANS = [
+    (_FACETS, 'SCAN product USING COVERING INDEX ix_product_category_price',
+     'category facet counts every product the other filters allow; cached per filter state'),
+    (_FACETS, 'SCAN product USING COVERING INDEX ix_product_price',
+     'price facet buckets every product the other filters allow; cached per filter state'),
+    (r' FROM product ORDER BY product\.price (ASC|DESC), product\.id (ASC|DESC) LIMIT \? OFFSET \?$',
+     'SCAN product USING INDEX ix_product_price',
+     'unfiltered shop page by price walks the index and stops after LIMIT rows'),
+    (r' FROM product ORDER BY product\.name ASC, product\.id ASC LIMIT \? OFFSET \?$',
+     'SCAN product USING INDEX ix_product_name',
+     'unfiltered shop page by name walks the index and stops after LIMIT rows'),
+    (r' FROM "order" LEFT OUTER JOIN user AS user_1 ON user_1\.id = "order"\.user_id '
+     r'ORDER BY "order"\.created_at DESC, "order"\.id DESC LIMIT \? OFFSET \?$',
+     'SCAN order USING INDEX ix_order_created_at',
+     'newest orders walk the index backwards and stop after LIMIT rows'),
+    (r' FROM user ORDER BY user\.id ASC LIMIT \? OFFSET \?$', 'SCAN user',
+     'admin user list walks the primary key and stops after LIMIT rows'),
+    (_DASHBOARD_TOTALS, 'SCAN product USING COVERING INDEX ix_product_price',
+     'dashboard product total; cached for STATS_CACHE_TTL'),
+    (_DASHBOARD_TOTALS, 'SCAN user USING COVERING INDEX sqlite_autoindex_user_1',
+     'dashboard user total; cached for STATS_CACHE_TTL'),
+    (r'^SELECT product\.category_id AS product_category_id, count\(product\.id\) AS count_1 '
+     r'FROM product GROUP BY product\.category_id$',
+     'SCAN product USING COVERING INDEX ix_product_category_price',
+     'admin categories page shows the product count of every category'),
+]
+
+_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(.*)$')
+
+def allowed_scan(statement, detail):
+    """The reason `detail` is an accepted plan step of `statement`, or None"""
+    statement = ' '.join(statement.split())
+    for pattern, allowed_detail, reason in ALLOWED_SCANS:
+        if detail == allowed_detail and re.search(pattern, statement):
+            return reason
+    return None
+
+def full_scans(statement, plan_details):
+    """Plan steps that read a whole table or index instead of seeking into one, unless allowed"""
+    scans = []
+    for detail in plan_details:
+        match = _SCAN_RE.match(detail)
+        if not match:
+            continue
+        table, rest = match.groups()
+        if table == 'CONSTANT' or table in SMALL_TABLES or 'VIRTUAL TABLE' in rest:
+            continue
+        if allowed_scan(statement, detail):
+            continue
+        scans.append(detail)
+    return scans
+
+def explain(connection, statement, parameters):
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows]
+
+class ParameterCounter(StatementCounter):
+    """StatementCounter that also keeps each statement's parameters"""
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            self.statements.append((statement, parameters))
+
+def check_plans(verbose=False):
+    init_db(app)
+    with app.app_context():
+        seed_orders()
+        engine = db.engine
+
+    credentials = {'user': 'user123', 'admin': 'admin123'}
+    clients = {None: app.test_client()}
+    for username, password in credentials.items():
+        clients[username] = app.test_client()
+        clients[username].post('/login', data={'username': username, 'password': password})
+
+    failures = []
+    for login_as, url in HOT_ROUTES:
+        with ParameterCounter(engine) as counter:
+            response = clients[login_as].get(url)
+
+        problems = []
+        plans = []
+        with app.app_context(), engine.connect() as connection:
+            for statement, parameters in counter.statements:
+                if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                    continue
+                plan = explain(connection, statement, parameters)
+                plans.append((statement, plan))
+                scans = full_scans(statement, plan)
+                if scans:
+                    problems.append((statement, scans))
+
+        ok = response.status_code == 200 and not problems
+        print(f"{'✅' if ok else '❌'} {url:<52} (HTTP {response.status_code})")
+        for statement, scans in problems:
+            print(f"      {' '.join(statement.split())[:100]}")
+            for detail in scans:
+                print(f"         full scan: {detail}")
+        if verbose:
+            for statement, plan in plans:
+                print(f"      {' '.join(statement.split())[:100]}")
+                for detail in plan:
+                    reason = allowed_scan(statement, detail)
+                    print(f"         {detail}" + (f"  (allowed: {reason})" if reason else ''))
+        if not ok:
+            failures.append(url)
+    return failures
+
+if __name__ == '__main__':
+    print("🔎 ZEECLOTHS Query Plan Check")
+    print("=" * 60)
+    failures = check_plans(verbose='-v' in sys.argv)
+    print("=" * 60)
+    if failures:
+        print(f"❌ {len(failures)} route(s) with full table scans: {', '.join(failures)}")
+        sys.exit(1)
+    print("🎉 No hot route query falls back to a full table scan")
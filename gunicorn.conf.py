@@ -0,0 +1,38 @@
+"""
+Gunicorn settings for `gunicorn -c gunicorn.conf.py wsgi:app`.
+
+The app is loaded (migrated and warmed up) once in the master and the
+workers are forked from it. Set WEB_CONCURRENCY, GUNICORN_THREADS and BIND
+to size and place the server.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def on_starting(server):
+    # Metrics totals start over with the server, like a single process's would. This runs once in
+    # the master before any worker exists, so no worker's snapshot file is deleted, preloaded or not
+    from app import create_app
+    from services.metrics import clear_metrics_dir
+    clear_metrics_dir(create_app())
+
+
+def post_fork(server, worker):
+    # SQLite connections opened by the master (migrations, warm-up) must not be shared
+    # across processes; each worker opens its own on first use
+    from wsgi import app
+    from models import db
+    from services import jobs
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    jobs.start_workers(app)
@@ -2,13 +2,15 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 import uuid
+from services.database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
+    # scrypt hashes are ~160 chars; SQLite does not enforce the declared length
     password_hash = db.Column(db.String(120), nullable=False)
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
@@ -37,6 +39,30 @@ class Product(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
+    variants = db.relationship('ProductVariant', backref='product', lazy=True,
+                               cascade='all, delete-orphan')
+
+    __table_args__ = (
+        # Category pages and category + price filters/sorts
+        db.Index('ix_product_category_price', 'category_id', 'price'),
+        db.Index('ix_product_price', 'price'),
+        db.Index('ix_product_name', 'name'),
+    )
+
+class ProductVariant(db.Model):
+    """A purchasable size/color combination of a product with its own stock"""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    size = db.Column(db.String(10))
+    color = db.Column(db.String(20))
+    stock = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'size', 'color', name='uq_product_variant_product_size_color'),
+        # Serve /shop size and color filters straight from the index
+        db.Index('ix_product_variant_size_product', 'size', 'product_id'),
+        db.Index('ix_product_variant_color_product', 'color', 'product_id'),
+    )
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,6 +76,13 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     items = db.relationship('OrderItem', backref='order', lazy=True)
 
+    __table_args__ = (
+        # Profile order history, admin status filter and newest-first listings
+        db.Index('ix_order_user_created', 'user_id', 'created_at'),
+        db.Index('ix_order_status_created', 'status', 'created_at'),
+        db.Index('ix_order_created_at', 'created_at'),
+    )
+
     def __init__(self, **kwargs):
         super(Order, self).__init__(**kwargs)
         if not self.order_number:
@@ -64,3 +97,112 @@ class OrderItem(db.Model):
     size = db.Column(db.String(10))
     color = db.Column(db.String(20))
 
+    __table_args__ = (
+        db.Index('ix_order_item_order', 'order_id'),
+        db.Index('ix_order_item_product', 'product_id'),
+    )
+
+class IdempotencyKey(db.Model):
+    """Remembers which order a client-supplied idempotency key produced"""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    order = db.relationship('Order')
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),)
+
+class DailyRevenue(db.Model):
+    """Order totals per day and status, maintained as orders are written"""
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+
+class MonthlyRevenue(db.Model):
+    """Order totals per month (YYYY-MM) and status"""
+    month = db.Column(db.String(7), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+
+class SchemaVersion(db.Model):
+    """Migrations applied to this database (see services/migrations.py)"""
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ProductPair(db.Model):
+    """Number of orders containing both products, stored in both directions"""
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    other_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # A product's strongest pairs, read straight from the index
+        db.Index('ix_product_pair_product_count', 'product_id', 'order_count'),
+    )
+
+class ProductNeighbors(db.Model):
+    """A product's top-K frequently-bought-together products as a JSON list of ids, best first"""
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    neighbor_ids = db.Column(db.Text, nullable=False, default='[]')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Job(db.Model):
+    """A queued background job (see services/jobs.py); finished jobs are deleted, failed ones kept"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    # Claimed jobs are hidden until this time; a crashed worker's job reappears after it
+    visible_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # The next visible job, read straight from the index
+        db.Index('ix_job_status_visible_at', 'status', 'visible_at'),
+    )
+
+class ThrottleBucket(db.Model):
+    """Token bucket of one login/registration throttle key, shared by every server process"""
+    key = db.Column(db.String(200), primary_key=True)  # e.g. "LOGIN_IP:203.0.113.7"
+    tokens = db.Column(db.Float, nullable=False)
+    allowed = db.Column(db.Boolean, nullable=False, default=True)  # whether the last attempt got a token
+    updated_at = db.Column(db.Float, nullable=False)  # unix time
+
+    __table_args__ = (
+        db.Index('ix_throttle_bucket_updated_at', 'updated_at'),
+    )
+
+class Cart(db.Model):
+    """A shopping cart, owned by a user or, before login, by an anonymous session token"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True)
+    session_token = db.Column(db.String(64), unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    items = db.relationship('CartItem', backref='cart', cascade='all, delete-orphan',
+                            order_by='CartItem.id', lazy=True)
+
+class CartItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cart_id = db.Column(db.Integer, db.ForeignKey('cart.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    size = db.Column(db.String(10))
+    color = db.Column(db.String(20))
+    # Price when the line was added, so the cart can point out price changes
+    added_price = db.Column(db.Float)
+    added_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_cart_item_cart', 'cart_id'),
+    )
@@ -5,15 +5,19 @@ This script will reset the database and create hardcoded users.
 """
 
 import os
-from app import app, init_db
+from app import create_app, init_db
 from models import db, User
+from services.search import drop_search_index
 from werkzeug.security import generate_password_hash
 
+app = create_app()
+
 def reset_database():
     """Reset the database and create users"""
     with app.app_context():
-        # Drop all tables
+        # Drop all tables (the search index is not part of the models)
         print("🗑️  Dropping all tables...")
+        drop_search_index()
         db.drop_all()
         
         # Create all tables
@@ -22,7 +26,7 @@ def reset_database():
         
         # Initialize database with sample data
         print("📊 Initializing sample data...")
-        init_db()
+        init_db(app)
         
         # Verify users were created
         admin_user = User.query.filter_by(email='admin@zeecloths.com').first()
@@ -1,9 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 from models import db, Product, Category, Order, User, OrderItem
+from services.catalog import invalidate_catalog
+from services.pagination import paginate_request
+from services import rollups
+from services.stats import get_stats, invalidate_stats
+from services.orders import OrderError, change_order_status, order_detail_options
+from services.variants import sync_variants, variant_options
+from services.images import save_product_image
+from services.database import read_only
+from services import order_io, product_io
+from sqlalchemy.orm import joinedload
 from functools import wraps
-import os
 import json
 from datetime import datetime
 
@@ -23,26 +31,31 @@ def admin_required(f):
 @login_required
 @admin_required
 def dashboard():
-    total_products = Product.query.count()
-    total_orders = Order.query.count()
-    total_users = User.query.count()
-    total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
-    
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
+    stats = get_stats()
     
     return render_template('admin/dashboard.html',
-                         total_products=total_products,
-                         total_orders=total_orders,
-                         total_users=total_users,
-                         total_revenue=total_revenue,
-                         recent_orders=recent_orders)
+                         total_products=stats['total_products'],
+                         total_orders=stats['total_orders'],
+                         total_users=stats['total_users'],
+                         total_customers=stats['total_users'],
+                         total_revenue=stats['total_revenue'],
+                         recent_orders=stats['recent_orders'])
+
+@admin_bp.route('/api/stats')
+@login_required
+@admin_required
+def api_stats():
+    return jsonify(get_stats())
 
 @admin_bp.route('/products')
 @login_required
 @admin_required
 def products():
-    page = request.args.get('page', 1, type=int)
-    products = Product.query.paginate(page=page, per_page=20, error_out=False)
+    products = paginate_request(
+        Product.query.options(joinedload(Product.category)),
+        [(Product.id, False)],
+        per_page=20
+    )
     return render_template('admin/products.html', products=products)
 
 @admin_bp.route('/products/add', methods=['GET', 'POST'])
@@ -63,9 +76,11 @@ def add_product():
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename:
-                filename = secure_filename(file.filename)
-                file.save(os.path.join('static/images/products', filename))
-                image_url = f'/static/images/products/{filename}'
+                uploaded_url = save_product_image(file)
+                if uploaded_url:
+                    image_url = uploaded_url
+                else:
+                    flash('Unsupported image type, using the default image', 'error')
         
         product = Product(
             name=name,
@@ -77,9 +92,12 @@ def add_product():
             sizes=json.dumps(sizes),
             colors=json.dumps(colors)
         )
+        sync_variants(product, sizes, colors, rebalance=True)
         
         db.session.add(product)
         db.session.commit()
+        invalidate_catalog()
+        invalidate_stats()
         
         flash('Product added successfully!', 'success')
         return redirect(url_for('admin.products'))
@@ -94,29 +112,36 @@ def edit_product(product_id):
     product = Product.query.get_or_404(product_id)
     
     if request.method == 'POST':
+        old_stock = product.stock
+        sizes = request.form.getlist('sizes')
+        colors = request.form.getlist('colors')
         product.name = request.form.get('name')
         product.description = request.form.get('description')
         product.price = float(request.form.get('price'))
         product.stock = int(request.form.get('stock'))
         product.category_id = int(request.form.get('category_id'))
-        product.sizes = json.dumps(request.form.getlist('sizes'))
-        product.colors = json.dumps(request.form.getlist('colors'))
+        product.sizes = json.dumps(sizes)
+        product.colors = json.dumps(colors)
+        # A new total from the form is spread over the variants; otherwise keep per-variant stock
+        sync_variants(product, sizes, colors, rebalance=product.stock != old_stock)
         
         # Handle image upload
         if 'image' in request.files:
             file = request.files['image']
             if file and file.filename:
-                filename = secure_filename(file.filename)
-                file.save(os.path.join('static/images/products', filename))
-                product.image_url = f'/static/images/products/{filename}'
+                uploaded_url = save_product_image(file)
+                if uploaded_url:
+                    product.image_url = uploaded_url
+                else:
+                    flash('Unsupported image type, keeping the current image', 'error')
         
         db.session.commit()
+        invalidate_catalog()
         flash('Product updated successfully!', 'success')
         return redirect(url_for('admin.products'))
     
     categories = Category.query.all()
-    sizes = json.loads(product.sizes) if product.sizes else []
-    colors = json.loads(product.colors) if product.colors else []
+    sizes, colors = variant_options(product)
     
     return render_template('admin/edit_product.html', 
                          product=product, 
@@ -131,28 +156,86 @@ def delete_product(product_id):
     product = Product.query.get_or_404(product_id)
     db.session.delete(product)
     db.session.commit()
+    invalidate_catalog()
+    invalidate_stats()
     flash('Product deleted successfully!', 'success')
     return redirect(url_for('admin.products'))
 
+@admin_bp.route('/products/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_products():
+    result = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        extension = file.filename.rsplit('.', 1)[-1].lower() if file and '.' in file.filename else ''
+        if extension not in ('csv', 'jsonl', 'json'):
+            flash('Please upload a .csv or .jsonl file', 'error')
+        else:
+            result = product_io.import_products(file.stream, 'csv' if extension == 'csv' else 'jsonl')
+            if result.processed:
+                invalidate_catalog()
+                invalidate_stats()
+            flash(f'Imported {result.inserted} new and {result.updated} updated products, '
+                  f'{result.error_count} rows skipped', 'success' if not result.error_count else 'error')
+    
+    return render_template('admin/import_products.html', result=result)
+
+@admin_bp.route('/products/export')
+@read_only
+@login_required
+@admin_required
+def export_products():
+    file_format = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    filename = f"products-{datetime.utcnow():%Y%m%d}.{file_format}"
+    return Response(
+        stream_with_context(product_io.export_products(file_format)),
+        mimetype='text/csv' if file_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @admin_bp.route('/orders')
 @login_required
 @admin_required
 def orders():
-    page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', '')
     
-    query = Order.query
+    query = Order.query.options(joinedload(Order.user))
     if status_filter:
         query = query.filter_by(status=status_filter)
     
-    orders = query.order_by(Order.created_at.desc()).paginate(page=page, per_page=20, error_out=False)
-    return render_template('admin/orders.html', orders=orders)
+    orders = paginate_request(query, [(Order.created_at, True), (Order.id, True)], per_page=20)
+    return render_template('admin/orders.html', orders=orders, statuses=order_io.ORDER_STATUSES)
+
+@admin_bp.route('/orders/export')
+@read_only
+@login_required
+@admin_required
+def export_orders():
+    file_format = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    status = request.args.get('status') or None
+    try:
+        start, end = [datetime.strptime(request.args[key], '%Y-%m-%d') if request.args.get(key) else None
+                      for key in ('start', 'end')]
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format', 'error')
+        return redirect(url_for('admin.orders'))
+    if status and status not in order_io.ORDER_STATUSES:
+        flash('Unknown order status', 'error')
+        return redirect(url_for('admin.orders'))
+
+    filename = f"orders-{datetime.utcnow():%Y%m%d}.{file_format}"
+    return Response(
+        stream_with_context(order_io.export_orders(file_format, start=start, end=end, status=status)),
+        mimetype='text/csv' if file_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @admin_bp.route('/orders/<int:order_id>')
 @login_required
 @admin_required
 def order_detail(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(*order_detail_options()).get_or_404(order_id)
     return render_template('admin/order_detail.html', order=order)
 
 @admin_bp.route('/orders/<int:order_id>/update_status', methods=['POST'])
@@ -163,8 +246,15 @@ def update_order_status(order_id):
     new_status = request.form.get('status')
     
     if new_status in ['pending', 'processing', 'shipped', 'delivered', 'cancelled']:
-        order.status = new_status
+        try:
+            stock_changed = change_order_status(order, new_status)
+        except OrderError as e:
+            flash(e.message, 'error')
+            return redirect(url_for('admin.order_detail', order_id=order_id))
         db.session.commit()
+        if stock_changed:
+            invalidate_catalog()
+        invalidate_stats()
         flash('Order status updated successfully!', 'success')
     
     return redirect(url_for('admin.order_detail', order_id=order_id))
@@ -173,16 +263,25 @@ def update_order_status(order_id):
 @login_required
 @admin_required
 def users():
-    page = request.args.get('page', 1, type=int)
-    users = User.query.paginate(page=page, per_page=20, error_out=False)
-    return render_template('admin/users.html', users=users)
+    users = paginate_request(User.query, [(User.id, False)], per_page=20)
+    
+    # Order counts for the whole page in one grouped query
+    user_ids = [user.id for user in users.items]
+    order_counts = dict(db.session.query(Order.user_id, db.func.count(Order.id)).filter(
+        Order.user_id.in_(user_ids)
+    ).group_by(Order.user_id).all()) if user_ids else {}
+    
+    return render_template('admin/users.html', users=users, order_counts=order_counts)
 
 @admin_bp.route('/categories')
 @login_required
 @admin_required
 def categories():
     categories = Category.query.all()
-    return render_template('admin/categories.html', categories=categories)
+    product_counts = dict(db.session.query(Product.category_id, db.func.count(Product.id)).group_by(
+        Product.category_id
+    ).all())
+    return render_template('admin/categories.html', categories=categories, product_counts=product_counts)
 
 @admin_bp.route('/categories/add', methods=['POST'])
 @login_required
@@ -194,6 +293,7 @@ def add_category():
     category = Category(name=name, description=description)
     db.session.add(category)
     db.session.commit()
+    invalidate_catalog()
     
     flash('Category added successfully!', 'success')
     return redirect(url_for('admin.categories'))
@@ -207,6 +307,7 @@ def edit_category(category_id):
     category.description = request.form.get('description')
     
     db.session.commit()
+    invalidate_catalog()
     flash('Category updated successfully!', 'success')
     return redirect(url_for('admin.categories'))
 
@@ -217,6 +318,7 @@ def delete_category(category_id):
     category = Category.query.get_or_404(category_id)
     db.session.delete(category)
     db.session.commit()
+    invalidate_catalog()
     flash('Category deleted successfully!', 'success')
     return redirect(url_for('admin.categories'))
 
@@ -224,16 +326,12 @@ def delete_category(category_id):
 @login_required
 @admin_required
 def analytics():
-    # Basic analytics
-    total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
-    total_orders = Order.query.count()
+    # Totals come from the revenue rollups, not a scan of the order table
+    summary = rollups.revenue_summary()
+    total_revenue = summary['total_revenue']
+    total_orders = summary['total_orders']
     avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-    
-    # Monthly revenue
-    monthly_revenue = db.session.query(
-        db.func.strftime('%Y-%m', Order.created_at),
-        db.func.sum(Order.total_amount)
-    ).group_by(db.func.strftime('%Y-%m', Order.created_at)).all()
+    monthly_revenue = summary['monthly_revenue']
     
     return render_template('admin/analytics.html',
                          total_revenue=total_revenue,
@@ -0,0 +1,193 @@
+from flask import Blueprint, request
+from flask_login import current_user
+from models import db, Product, Order
+from services.api import api_response, cached_catalog_response, category_to_dict, product_detail_to_dict, \
+    product_to_dict
+from services.cart import add_items, find_cart, get_or_create_cart, parse_cart_items, replace_items, \
+    validate_lines, validated_cart
+from services.catalog import get_categories, get_featured_products, invalidate_catalog
+from services.recommendations import get_recommended_products
+from services.database import read_only
+from services.listing import filtered_products, listing_filters, listing_order
+from services.facets import get_facets
+from services.order_io import ORDER_STATUSES
+from services.orders import OrderError, change_order_status
+from services.pagination import keyset_paginate
+from services.stats import invalidate_stats
+from routes.order_routes import create, order_to_dict
+from sqlalchemy.orm import joinedload, selectinload
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Placing an order is the same endpoint as /api/orders
+api_bp.add_url_rule('/orders', 'create_order', create, methods=['POST'])
+
+def _page_size(default):
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, 100))
+
+@api_bp.errorhandler(404)
+def not_found(error):
+    return api_response({'error': 'Not found'}, 404)
+
+@api_bp.route('/products')
+@read_only
+def products():
+    def load():
+        filters = listing_filters(request.args)
+        page = keyset_paginate(
+            filtered_products(filters, Product.query.options(joinedload(Product.category))),
+            listing_order(filters),
+            cursor=request.args.get('cursor'),
+            per_page=_page_size(12)
+        )
+        data = {
+            'products': [product_to_dict(product) for product in page.items],
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor
+        }
+        if request.args.get('facets'):
+            data['facets'] = get_facets(filters)
+        return data
+    return cached_catalog_response(load, 'products')
+
+@api_bp.route('/products/<int:product_id>')
+@read_only
+def product_detail(product_id):
+    def load():
+        product = Product.query.options(
+            joinedload(Product.category), selectinload(Product.variants)
+        ).get_or_404(product_id)
+        return {'product': product_detail_to_dict(product, get_recommended_products(product))}
+    return cached_catalog_response(load, 'product')
+
+@api_bp.route('/categories')
+@read_only
+def categories():
+    return cached_catalog_response(
+        lambda: {'categories': [category_to_dict(category) for category in get_categories()]},
+        'categories'
+    )
+
+@api_bp.route('/featured-products')
+@read_only
+def featured_products():
+    return cached_catalog_response(
+        lambda: {'products': [product_to_dict(product) for product in get_featured_products()]},
+        'products'
+    )
+
+def _user_orders(user_id):
+    page = keyset_paginate(
+        Order.query.options(selectinload(Order.items)).filter_by(user_id=user_id),
+        [(Order.created_at, True), (Order.id, True)],
+        cursor=request.args.get('cursor'),
+        per_page=_page_size(20)
+    )
+    return api_response({
+        'orders': [order_to_dict(order) for order in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    }, key='orders')
+
+@api_bp.route('/orders')
+@read_only
+def orders():
+    if not current_user.is_authenticated:
+        return api_response({'error': 'Authentication required'}, 401)
+    return _user_orders(current_user.id)
+
+@api_bp.route('/orders/user/<int:user_id>')
+@read_only
+def user_orders(user_id):
+    if not current_user.is_authenticated:
+        return api_response({'error': 'Authentication required'}, 401)
+    if user_id != current_user.id and not current_user.is_admin:
+        return api_response({'error': 'Access denied'}, 403)
+    return _user_orders(user_id)
+
+@api_bp.route('/orders/<int:order_id>')
+@read_only
+def order_detail(order_id):
+    if not current_user.is_authenticated:
+        return api_response({'error': 'Authentication required'}, 401)
+    order = Order.query.options(selectinload(Order.items)).get_or_404(order_id)
+    if order.user_id != current_user.id and not current_user.is_admin:
+        return api_response({'error': 'Access denied'}, 403)
+    return api_response({'order': order_to_dict(order)}, key='order')
+
+@api_bp.route('/orders/<int:order_id>/status', methods=['PUT'])
+def update_order_status(order_id):
+    if not current_user.is_authenticated or not current_user.is_admin:
+        return api_response({'error': 'Admin privileges required'}, 403)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return api_response({'error': 'Request body must be a JSON object'}, 400)
+    new_status = data.get('status')
+    if new_status not in ORDER_STATUSES:
+        return api_response({'error': f"status must be one of {', '.join(ORDER_STATUSES)}"}, 400)
+
+    order = Order.query.get_or_404(order_id)
+    try:
+        stock_changed = change_order_status(order, new_status)
+    except OrderError as e:
+        return api_response({'error': e.message, 'details': e.details}, e.status)
+    db.session.commit()
+    if stock_changed:
+        invalidate_catalog()
+    invalidate_stats()
+    return api_response({'order': order_to_dict(order)}, key='order')
+
+@api_bp.route('/cart')
+@read_only
+def cart():
+    return api_response({'cart': validated_cart(find_cart())})
+
+def _cart_items(data):
+    if not isinstance(data, dict):
+        raise OrderError('Request body must be a JSON object')
+    return parse_cart_items(data.get('items'))
+
+@api_bp.route('/cart', methods=['PUT'])
+def replace_cart():
+    try:
+        lines = _cart_items(request.get_json(silent=True))
+        result = replace_items(get_or_create_cart(), lines)
+    except OrderError as e:
+        db.session.rollback()
+        return api_response({'error': e.message, 'details': e.details}, e.status)
+    db.session.commit()
+    return api_response({'cart': result})
+
+@api_bp.route('/cart/items', methods=['POST'])
+def add_to_cart():
+    data = request.get_json(silent=True)
+    try:
+        # One line: {"product_id": 1, "quantity": 2, "size": "M", "color": "Black"}
+        lines = _cart_items({'items': [data] if isinstance(data, dict) else None})
+        result = add_items(get_or_create_cart(), lines)
+    except OrderError as e:
+        db.session.rollback()
+        return api_response({'error': e.message, 'details': e.details}, e.status)
+    db.session.commit()
+    return api_response({'cart': result})
+
+@api_bp.route('/cart', methods=['DELETE'])
+def clear_cart():
+    cart = find_cart()
+    if cart is not None:
+        db.session.delete(cart)
+        db.session.commit()
+    return api_response({'cart': validate_lines([])})
+
+@api_bp.route('/cart/validate', methods=['POST'])
+def validate_cart():
+    """Re-check a client-held cart (`items`), or the stored one when no items are sent"""
+    data = request.get_json(silent=True) or {}
+    if isinstance(data, dict) and 'items' not in data:
+        return api_response({'cart': validated_cart(find_cart())})
+    try:
+        lines = _cart_items(data)
+    except OrderError as e:
+        return api_response({'error': e.message, 'details': e.details}, e.status)
+    return api_response({'cart': validate_lines(lines)})
@@ -0,0 +1,68 @@
+from flask import Blueprint, request, jsonify
+from flask_login import current_user
+from services.orders import OrderError, create_order
+
+order_bp = Blueprint('orders', __name__, url_prefix='/api/orders')
+
+def order_to_dict(order):
+    return {
+        'id': order.id,
+        'order_number': order.order_number,
+        'status': order.status,
+        'total_amount': order.total_amount,
+        'payment_method': order.payment_method,
+        'shipping_address': order.shipping_address,
+        'billing_address': order.billing_address,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'items': [
+            {
+                'product_id': item.product_id,
+                'quantity': item.quantity,
+                'price': item.price,
+                'size': item.size,
+                'color': item.color
+            }
+            for item in order.items
+        ]
+    }
+
+@order_bp.route('', methods=['POST'])
+def create():
+    if not current_user.is_authenticated:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+    # Clients retrying after a timeout resend the same key to avoid duplicates
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if idempotency_key is not None and not isinstance(idempotency_key, str):
+        return jsonify({'error': 'Idempotency key must be a string'}), 400
+    if idempotency_key and len(idempotency_key) > 64:
+        return jsonify({'error': 'Idempotency key must be at most 64 characters'}), 400
+
+    for field in ('payment_method', 'shipping_address', 'billing_address'):
+        if data.get(field) is not None and not isinstance(data[field], str):
+            return jsonify({'error': f'{field} must be a string'}), 400
+    # Order pages show the payment method, so an order cannot be placed without one
+    if not (data.get('payment_method') or '').strip():
+        return jsonify({'error': 'payment_method is required'}), 400
+
+    try:
+        order, created = create_order(
+            current_user,
+            data.get('items'),
+            payment_method=data.get('payment_method'),
+            shipping_address=data.get('shipping_address'),
+            billing_address=data.get('billing_address'),
+            idempotency_key=idempotency_key
+        )
+    except OrderError as e:
+        return jsonify({'error': e.message, 'details': e.details}), e.status
+
+    response = jsonify({'order': order_to_dict(order)})
+    response.status_code = 201 if created else 200
+    if not created:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
@@ -2,128 +2,96 @@ from flask import Blueprint, render_template, request, jsonify, session, redirec
 from flask_login import login_required, current_user
 from models import db, Product, Category, User, Order, OrderItem
 from sqlalchemy import or_, desc, asc
+from services import search as search_index
+from services.catalog import get_categories
+from services.recommendations import get_recommended_products
+from services.page_cache import cache_page
+from services.database import read_only
+from services.pagination import paginate_request
+from services.orders import order_detail_options
+from services.listing import filtered_products, listing_filters, listing_order
+from services.facets import get_facets
+from sqlalchemy.orm import joinedload
 import os
 
 shop_bp = Blueprint('shop', __name__)
 
 @shop_bp.route('/shop')
+@read_only
+@cache_page
 def shop():
-    # Get query parameters
-    page = request.args.get('page', 1, type=int)
-    category_id = request.args.get('category', type=int)
-    search = request.args.get('search', '')
-    sort_by = request.args.get('sort', '')
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
-    
-    # Base query
-    query = Product.query
-    
-    # Apply filters
-    if category_id:
-        query = query.filter(Product.category_id == category_id)
-    
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            or_(
-                Product.name.ilike(search_term),
-                Product.description.ilike(search_term),
-                Category.name.ilike(search_term)
-            )
-        ).join(Category)
-    
-    if min_price is not None:
-        query = query.filter(Product.price >= min_price)
-    
-    if max_price is not None:
-        query = query.filter(Product.price <= max_price)
-    
-    # Apply sorting
-    if sort_by == 'name':
-        query = query.order_by(Product.name.asc())
-    elif sort_by == 'price_low':
-        query = query.order_by(Product.price.asc())
-    elif sort_by == 'price_high':
-        query = query.order_by(Product.price.desc())
-    elif sort_by == 'newest':
-        query = query.order_by(Product.id.desc())
-    else:
-        query = query.order_by(Product.id.desc())
+    filters = listing_filters(request.args)
+    query = filtered_products(filters)
     
     # Pagination
     per_page = 12
-    products = query.paginate(
-        page=page, 
-        per_page=per_page, 
-        error_out=False
-    )
+    products = paginate_request(query, listing_order(filters), per_page=per_page)
     
     # Get categories for filter
-    categories = Category.query.all()
+    categories = get_categories()
+    facets = get_facets(filters)
     
     return render_template('shop.html',
                          products=products,
                          categories=categories,
-                         current_category=category_id,
-                         search=search,
-                         sort_by=sort_by,
-                         min_price=min_price,
-                         max_price=max_price)
+                         facets=facets,
+                         current_category=filters.category_id,
+                         search=filters.search,
+                         sort_by=filters.sort_by,
+                         min_price=filters.min_price,
+                         max_price=filters.max_price,
+                         sizes=filters.sizes,
+                         colors=filters.colors)
 
 @shop_bp.route('/product/<int:product_id>')
+@read_only
+@cache_page
 def product_detail(product_id):
     product = Product.query.get_or_404(product_id)
-    related_products = Product.query.filter(
-        Product.category_id == product.category_id,
-        Product.id != product_id
-    ).limit(4).all()
+    related_products = get_recommended_products(product)
     
     return render_template('product_detail.html', 
                          product=product, 
                          related_products=related_products)
 
 @shop_bp.route('/search')
+@read_only
 def search():
     query = request.args.get('q', '')
     if not query:
         return redirect(url_for('shop.shop'))
     
-    page = request.args.get('page', 1, type=int)
-    
-    # Search in product name, description, and category
-    search_term = f"%{query}%"
-    products = Product.query.filter(
-        or_(
-            Product.name.ilike(search_term),
-            Product.description.ilike(search_term),
-            Category.name.ilike(search_term)
-        )
-    ).join(Category).paginate(
-        page=page, 
-        per_page=12, 
-        error_out=False
+    # Ranked full-text search over product name, description, and category
+    pagination = paginate_request(
+        search_index.filter_products(
+            Product.query.options(joinedload(Product.category)), query, ranked=False
+        ),
+        search_index.relevance_order(query),
+        per_page=12
     )
     
-    categories = Category.query.all()
+    categories = get_categories()
     
     return render_template('search_results.html',
-                         products=products,
+                         products=pagination.items,
+                         pagination=pagination,
+                         total_results=pagination.total,
                          categories=categories,
+                         query=query,
                          search_query=query)
 
 @shop_bp.route('/category/<int:category_id>')
+@read_only
+@cache_page
 def category(category_id):
     category = Category.query.get_or_404(category_id)
-    page = request.args.get('page', 1, type=int)
-    
-    products = Product.query.filter_by(category_id=category_id).paginate(
-        page=page, 
-        per_page=12, 
-        error_out=False
+    products = paginate_request(
+        Product.query.filter_by(category_id=category_id),
+        [(Product.id, True)],
+        per_page=12
     )
     
-    categories = Category.query.all()
+    categories = get_categories()
     
     return render_template('shop.html',
                          products=products,
@@ -136,7 +104,7 @@ def category(category_id):
 @shop_bp.route('/order_confirmation/<int:order_id>')
 @login_required
 def order_confirmation(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(*order_detail_options()).get_or_404(order_id)
     if order.user_id != current_user.id:
         return redirect(url_for('shop.shop'))
     
@@ -1,7 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, make_response
 from flask_login import login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from models import db, User, Order
+from services.stats import invalidate_stats
+from services.orders import order_detail_options
+from services.auth import find_login_user, hash_password, invalidate_user, throttle_login, throttle_registration, \
+    verify_password
+from services.cart import merge_session_cart
+import math
 
 user_bp = Blueprint('user', __name__)
 
@@ -12,13 +17,25 @@ def login():
         password = request.form.get('password')
         remember = request.form.get('remember') == 'on'
         
-        # Try to find user by username or email
-        user = User.query.filter_by(username=username_or_email).first()
-        if not user:
-            user = User.query.filter_by(email=username_or_email).first()
+        # Throttle per IP and per account before doing any hashing work
+        wait = throttle_login(request.remote_addr, username_or_email)
+        if wait:
+            flash('Too many login attempts. Please try again shortly.', 'error')
+            response = make_response(render_template('login.html'), 429)
+            response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+            return response
         
-        if user and check_password_hash(user.password_hash, password):
+        user = find_login_user(username_or_email)
+        verified = verify_password(user, password) if user else False
+        
+        if verified is None:
+            flash('The server is busy. Please try again.', 'error')
+            response = make_response(render_template('login.html'), 503)
+            response.headers['Retry-After'] = '1'
+            return response
+        if verified:
             login_user(user, remember=remember)
+            merge_session_cart(user)
             next_page = request.args.get('next')
             if next_page:
                 return redirect(next_page)
@@ -38,6 +55,14 @@ def register():
         last_name = request.form.get('last_name')
         phone = request.form.get('phone')
         
+        # Hashing the new password is as expensive as a login attempt
+        wait = throttle_registration(request.remote_addr)
+        if wait:
+            flash('Too many registrations. Please try again later.', 'error')
+            response = make_response(render_template('register.html'), 429)
+            response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+            return response
+        
         # Check if user already exists
         if User.query.filter_by(email=email).first():
             flash('Email already registered', 'error')
@@ -51,7 +76,7 @@ def register():
         user = User(
             username=username,
             email=email,
-            password_hash=generate_password_hash(password),
+            password_hash=hash_password(password),
             first_name=first_name,
             last_name=last_name,
             phone=phone
@@ -59,6 +84,8 @@ def register():
         
         db.session.add(user)
         db.session.commit()
+        invalidate_user(user.id)  # SQLite can hand out the id of a deleted user again
+        invalidate_stats()
         
         flash('Registration successful! Please log in.', 'success')
         return redirect(url_for('user.login'))
@@ -74,7 +101,9 @@ def logout():
 @user_bp.route('/profile')
 @login_required
 def profile():
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
+    orders = Order.query.options(*order_detail_options()).filter_by(
+        user_id=current_user.id
+    ).order_by(Order.created_at.desc()).all()
     return render_template('profile.html', orders=orders)
 
 @user_bp.route('/profile/edit', methods=['GET', 'POST'])
@@ -87,6 +116,7 @@ def edit_profile():
         current_user.address = request.form.get('address')
         
         db.session.commit()
+        invalidate_user(current_user.id)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('user.profile'))
     
@@ -95,7 +125,7 @@ def edit_profile():
 @user_bp.route('/order/<int:order_id>')
 @login_required
 def order_detail(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(*order_detail_options()).get_or_404(order_id)
     if order.user_id != current_user.id and not current_user.is_admin:
         flash('Access denied', 'error')
         return redirect(url_for('user.profile'))
@@ -0,0 +1,4 @@
+# Services package
+
+
+
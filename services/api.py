@@ -0,0 +1,156 @@
+"""
+Helpers for the versioned JSON API (`routes/api_routes.py`).
+
+Responses are encoded compactly (with orjson when it is installed), trimmed
+to the fields a client asks for with `?fields=`, and gzipped when the client
+accepts it. Catalog reads cache the final encoded (and compressed) bytes,
+keyed on the URL and the catalog version, so repeat requests skip the
+database, the serializer and the compressor.
+"""
+import gzip
+import hashlib
+import json
+import threading
+
+from flask import current_app, request
+
+from services.cache import TTLCache
+from services.catalog import catalog_state
+from services.variants import variant_options
+
+try:
+    import orjson
+except ImportError:  # the standard library encoder is the fallback
+    orjson = None
+
+MIMETYPE = 'application/json'
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def dumps(data):
+    """Compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=str).encode()
+
+
+def requested_fields():
+    """`?fields=id,name,category.name` as a nested dict, or None for every field"""
+    raw = request.args.get('fields', '')
+    if not raw.strip():
+        return None
+    tree = {}
+    for path in raw.split(','):
+        node = tree
+        for part in [part.strip() for part in path.split('.')]:
+            if not part:
+                break
+            node = node.setdefault(part, {})
+    return tree or None
+
+
+def select_fields(data, fields):
+    """Keep only `fields` of a dict (or of every dict in a list); an empty subtree keeps the whole value"""
+    if not fields:
+        return data
+    if isinstance(data, list):
+        return [select_fields(item, fields) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {key: select_fields(data[key], subtree) for key, subtree in fields.items() if key in data}
+
+
+def category_to_dict(category):
+    return {
+        'id': category.id,
+        'name': category.name,
+        'description': category.description,
+        'image_url': category.image_url
+    }
+
+
+def product_to_dict(product):
+    """A catalog product; works for ORM instances and catalog snapshots"""
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'stock': product.stock,
+        'image_url': product.image_url,
+        'category_id': product.category_id,
+        'category': category_to_dict(product.category) if product.category else None,
+        'created_at': product.created_at.isoformat() if product.created_at else None
+    }
+
+
+def product_detail_to_dict(product, related):
+    sizes, colors = variant_options(product)
+    return dict(
+        product_to_dict(product),
+        sizes=sizes,
+        colors=colors,
+        variants=[
+            {'id': variant.id, 'size': variant.size, 'color': variant.color, 'stock': variant.stock}
+            for variant in sorted(product.variants, key=lambda variant: variant.id)
+        ],
+        related=[product_to_dict(item) for item in related]
+    )
+
+
+def _accepts_gzip():
+    return 'gzip' in request.accept_encodings
+
+
+def _payload(body):
+    """Cacheable entry for an encoded body, with a gzip copy when it is worth compressing"""
+    entry = {'body': body, 'gzip': None, 'etag': hashlib.sha1(body).hexdigest()}
+    if len(body) >= current_app.config.get('API_GZIP_MIN_SIZE', 1024):
+        entry['gzip'] = gzip.compress(body, compresslevel=current_app.config.get('API_GZIP_LEVEL', 6), mtime=0)
+    return entry
+
+
+def _response(entry, status=200):
+    compressed = entry['gzip'] is not None and _accepts_gzip()
+    response = current_app.response_class(entry['gzip'] if compressed else entry['body'],
+                                          status=status, mimetype=MIMETYPE)
+    if compressed:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _encode(data, key):
+    if key is not None:
+        data = dict(data, **{key: select_fields(data[key], requested_fields())})
+    return _payload(dumps(data))
+
+
+def api_response(data, status=200, key=None):
+    """JSON response for `data`; `?fields=` trims `data[key]` (each item, if it is a list)"""
+    return _response(_encode(data, key), status)
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLCache(
+                    maxsize=current_app.config.get('API_CACHE_SIZE', 512),
+                    ttl=current_app.config.get('API_CACHE_TTL', 300)
+                )
+    return _cache
+
+
+def cached_catalog_response(loader, key):
+    """`api_response(loader(), key=key)` served from the payload cache until the catalog changes"""
+    if not current_app.config.get('API_CACHE_ENABLED', True):
+        return _response(_encode(loader(), key))
+    entry = _get_cache().get_or_set((request.full_path, catalog_state().version), lambda: _encode(loader(), key))
+    response = _response(entry)
+    # The gzip and identity bodies are different representations
+    response.set_etag(entry['etag'] + ('-gzip' if 'Content-Encoding' in response.headers else ''))
+    return response.make_conditional(request)
@@ -0,0 +1,232 @@
+"""
+Static asset build and serving.
+
+`flask build-assets` bundles the site CSS/JS (CSS minified, JS trimmed of
+indentation and blank lines), copies the stylesheets, scripts and site images
+to `static/dist/` under a content-hashed name, writes gzip (and, when the
+`brotli` package is installed, brotli) copies of text assets, and records the
+mapping in `static/dist/manifest.json`. Product images in the upload folder
+are left where they are; services/images.py already names and caches those.
+
+At runtime `url_for('static', filename=...)` is rewritten to the
+fingerprinted copy whenever the manifest has one, and `/static/dist/` is
+served precompressed with immutable cache headers. Without a build the
+original files are served exactly as before.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import abort, current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+from services.images import is_content_hashed
+
+try:
+    import brotli
+except ImportError:  # brotli copies are optional
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Bundles served by base.html, in load order
+BUNDLES = {
+    'css/site.css': ['css/styles.css', 'css/navbar.css', 'css/footer.css', 'css/cart.css'],
+    'js/site.js': ['js/main.js', 'js/cart.js'],
+}
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+IMMUTABLE_MAX_AGE = 31536000  # one year
+
+# A quoted string (kept verbatim, quoted url(...) included) or a comment (dropped)
+_CSS_STRING_OR_COMMENT_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+_CSS_STASHED_RE = re.compile(r'\x00(\d+)\x00')
+_CSS_SPACE_RE = re.compile(r'\s+')
+_CSS_PUNCT_RE = re.compile(r'\s*([{};>])\s*')
+_CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+_manifest = None
+
+
+def minify_css(source):
+    """Drop comments and redundant whitespace outside quoted strings; conservative enough for any valid CSS"""
+    strings = []
+
+    def stash(match):
+        if match.group(1) is None:
+            return ''
+        strings.append(match.group(1))
+        return f"\x00{len(strings) - 1}\x00"
+
+    source = _CSS_STRING_OR_COMMENT_RE.sub(stash, source)
+    source = _CSS_SPACE_RE.sub(' ', source)
+    source = _CSS_PUNCT_RE.sub(r'\1', source)
+    source = source.replace(';}', '}').strip()
+    return _CSS_STASHED_RE.sub(lambda match: strings[int(match.group(1))], source)
+
+
+def trim_js(source):
+    """Strip indentation and blank lines; not a minifier.
+
+    Shortening names or dropping comments safely needs a JS parser; this keeps
+    every statement intact and leaves the rest of the savings to gzip/brotli.
+    """
+    return '\n'.join(line.strip() for line in source.splitlines() if line.strip())
+
+
+def _fingerprint(name, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    root, ext = posixpath.splitext(name)
+    return f"{root}.{digest}{ext}"
+
+
+def _write(dist, name, data):
+    path = os.path.join(dist, *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if posixpath.splitext(name)[1] in COMPRESSIBLE:
+        with open(f"{path}.gz", 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(f"{path}.br", 'wb') as f:
+                f.write(brotli.compress(data))
+
+
+def _rewrite_css_urls(name, source, manifest):
+    """Point relative url(...) references at their fingerprinted copies"""
+    def replace(match):
+        target = match.group(2)
+        if target.startswith(('/', 'data:', 'http:', 'https:', '#')):
+            return match.group(0)
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(name), target))
+        if resolved not in manifest:
+            return match.group(0)
+        return f"url('/static/{DIST_DIR}/{manifest[resolved]}')"
+    return _CSS_URL_RE.sub(replace, source)
+
+
+def build_assets(static_folder, upload_folder=None):
+    """Rebuild `static/dist/`; returns the manifest ({logical name: dist name})
+
+    `upload_folder` (product images) is skipped, as is `static/dist/` itself.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    skipped = {os.path.abspath(dist)}
+    if upload_folder:
+        skipped.add(os.path.abspath(upload_folder))
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    os.makedirs(dist)
+
+    # Plain files first so CSS can refer to their fingerprinted names
+    manifest = {}
+    stylesheets = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) not in skipped)
+        for filename in sorted(files):
+            if filename.startswith('.') or is_content_hashed(filename):
+                continue
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            if name.endswith('.css'):
+                stylesheets.append(name)
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            if name.endswith('.js'):
+                data = trim_js(data.decode('utf-8')).encode('utf-8')
+            manifest[name] = _fingerprint(name, data)
+            _write(dist, manifest[name], data)
+
+    css = {}
+    for name in stylesheets:
+        with open(os.path.join(static_folder, *name.split('/')), encoding='utf-8') as f:
+            css[name] = minify_css(_rewrite_css_urls(name, f.read(), manifest))
+        data = css[name].encode('utf-8')
+        manifest[name] = _fingerprint(name, data)
+        _write(dist, manifest[name], data)
+
+    for bundle, sources in BUNDLES.items():
+        if bundle.endswith('.css'):
+            data = '\n'.join(css[source] for source in sources)
+        else:
+            # Separate statements so a file missing its trailing semicolon cannot merge with the next
+            data = '\n;\n'.join(_read_js(dist, manifest[source]) for source in sources)
+        data = data.encode('utf-8')
+        manifest[bundle] = _fingerprint(bundle, data)
+        _write(dist, manifest[bundle], data)
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    load_manifest(static_folder)
+    return manifest
+
+
+def _read_js(dist, name):
+    with open(os.path.join(dist, *name.split('/')), encoding='utf-8') as f:
+        return f.read()
+
+
+def load_manifest(static_folder):
+    """(Re)read the build manifest; an empty one means serve the originals"""
+    global _manifest
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            _manifest = json.load(f)
+    except (OSError, ValueError):
+        _manifest = {}
+    return _manifest
+
+
+def get_manifest():
+    if _manifest is None:
+        return load_manifest(current_app.static_folder)
+    return _manifest
+
+
+def fingerprint_static_url(endpoint, values):
+    """url_defaults hook: send url_for('static', ...) to the fingerprinted copy"""
+    if endpoint != 'static' or not current_app.config.get('ASSET_FINGERPRINTING', True):
+        return
+    filename = values.get('filename')
+    built = get_manifest().get(filename)
+    if built:
+        values['filename'] = f"{DIST_DIR}/{built}"
+
+
+def asset_urls(bundle):
+    """Template global: the built bundle, or its source files when not built"""
+    if current_app.config.get('ASSET_FINGERPRINTING', True) and bundle in get_manifest():
+        return [url_for('static', filename=bundle)]
+    return [url_for('static', filename=source) for source in BUNDLES[bundle]]
+
+
+def send_asset(filename):
+    """Serve a built asset, precompressed when the client accepts it"""
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    path = safe_join(dist, filename)
+    if path is None:
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0]
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in request.accept_encodings and os.path.isfile(f"{path}{suffix}"):
+            response = send_from_directory(dist, f"{filename}{suffix}", mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(dist, filename, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,195 @@
+"""
+Login helpers.
+
+Password hashing is the most CPU-expensive thing the app does, so a login
+attempt has to get past three cheap gates before a hash is computed: a
+token bucket per client IP, a token bucket per account identifier, and a
+cap on how many hashes run at once; registrations get a bucket per client
+IP. The buckets live in the `throttle_bucket` table and are updated with one
+UPSERT per attempt, so the limits hold across every server process. The
+client IP is `request.remote_addr`, which is only the real client's address
+when PROXY_FIX_X_FOR tells the app how many proxies to trust. The account is found with a single
+query on username OR email (both are unique, indexed columns). Stored hashes
+made with an older method or cost are re-hashed with `PASSWORD_HASH_METHOD`
+after a successful login.
+
+The Flask-Login user loader reads through a small TTL/LRU cache of detached
+User instances, keyed by user id, a per-user generation bumped by
+`invalidate_user()` and a version kept in the user's session cookie (so a
+profile edit is also seen by other worker processes). A hit is merged into
+the request's session with `load=False`, which costs no SQL. Admins are
+never cached: their row is read on every request, so a demoted or deleted
+admin loses access immediately in every process.
+"""
+import threading
+import time
+
+from flask import current_app, has_request_context, session
+from sqlalchemy import case, delete, func, or_
+from sqlalchemy.dialects.sqlite import insert
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from models import db, ThrottleBucket, User
+from services.cache import TTLCache
+
+DEFAULT_HASH_METHOD = 'scrypt:32768:8:1'
+SESSION_VERSION_KEY = '_user_version'
+THROTTLES = ('LOGIN_IP', 'LOGIN_ACCOUNT', 'REGISTER_IP')
+
+
+_hash_slots = None
+_last_prune = 0.0
+
+
+def _prune_buckets(now):
+    """Delete buckets that have been full again for a while, at most every 10 minutes per process"""
+    global _last_prune
+    if now - _last_prune < 600:
+        return
+    _last_prune = now
+    config = current_app.config
+    refill_seconds = max(config.get(f'{kind}_BURST', 10) / (config.get(f'{kind}_PER_MINUTE', 10) / 60.0)
+                         for kind in THROTTLES)
+    db.session.execute(delete(ThrottleBucket).where(ThrottleBucket.updated_at < now - refill_seconds))
+
+
+def consume_token(kind, key):
+    """Take one token from `key`'s `kind` bucket (`{kind}_BURST` tokens refilled at `{kind}_PER_MINUTE`).
+
+    Returns 0 if the attempt is allowed, else seconds until the next token.
+    """
+    config = current_app.config
+    burst = config.get(f'{kind}_BURST', 10)
+    rate = config.get(f'{kind}_PER_MINUTE', 10) / 60.0
+    now = time.time()
+    _prune_buckets(now)
+    # Refill by the time passed since the last attempt and take a token, atomically in SQLite
+    refilled = func.min(burst, ThrottleBucket.tokens + (now - ThrottleBucket.updated_at) * rate)
+    stmt = insert(ThrottleBucket).values(key=f'{kind}:{key}'[:200], tokens=burst - 1, allowed=True, updated_at=now)
+    stmt = stmt.on_conflict_do_update(index_elements=['key'], set_={
+        'tokens': case((refilled >= 1, refilled - 1), else_=refilled),
+        'allowed': refilled >= 1,
+        'updated_at': now
+    }).returning(ThrottleBucket.tokens, ThrottleBucket.allowed)
+    tokens, allowed = db.session.execute(stmt).one()
+    db.session.commit()
+    return 0 if allowed else (1 - tokens) / rate
+
+
+def throttle_login(remote_addr, identifier):
+    """Seconds the client must wait before this attempt is allowed, or 0"""
+    if not current_app.config.get('LOGIN_THROTTLE_ENABLED', True):
+        return 0
+    wait = consume_token('LOGIN_IP', remote_addr or 'unknown')
+    if not wait and identifier:
+        wait = consume_token('LOGIN_ACCOUNT', identifier.strip().lower())
+    return wait
+
+
+def throttle_registration(remote_addr):
+    """Seconds the client must wait before registering another account, or 0"""
+    if not current_app.config.get('LOGIN_THROTTLE_ENABLED', True):
+        return 0
+    return consume_token('REGISTER_IP', remote_addr or 'unknown')
+
+
+def reset_throttles():
+    db.session.execute(delete(ThrottleBucket))
+    db.session.commit()
+
+
+def find_login_user(identifier):
+    """The user whose username or email is `identifier`, in one query"""
+    if not identifier:
+        return None
+    users = User.query.filter(or_(User.username == identifier, User.email == identifier)).limit(2).all()
+    # A username equal to someone else's email is possible; the username wins, as before
+    for user in users:
+        if user.username == identifier:
+            return user
+    return users[0] if users else None
+
+
+def _slots():
+    global _hash_slots
+    if _hash_slots is None:
+        _hash_slots = threading.BoundedSemaphore(current_app.config.get('PASSWORD_HASH_CONCURRENCY', 4))
+    return _hash_slots
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD))
+
+
+def verify_password(user, password):
+    """Check `password` against the user's hash, upgrading the hash if its method is outdated.
+
+    Returns True/False, or None when every hashing slot stayed busy for
+    `PASSWORD_HASH_WAIT` seconds (the caller should ask the client to retry).
+    """
+    slots = _slots()
+    if not slots.acquire(timeout=current_app.config.get('PASSWORD_HASH_WAIT', 2)):
+        return None
+    try:
+        if not check_password_hash(user.password_hash, password or ''):
+            return False
+        method = current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD)
+        if user.password_hash.split('$', 1)[0] != method:
+            user.password_hash = generate_password_hash(password, method=method)
+            db.session.commit()
+            invalidate_user(user.id)
+        return True
+    finally:
+        slots.release()
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+_generations = {}
+
+
+def _get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = TTLCache(
+                    maxsize=current_app.config.get('USER_CACHE_SIZE', 1024),
+                    ttl=current_app.config.get('USER_CACHE_TTL', 60)
+                )
+    return _user_cache
+
+
+def load_user(user_id):
+    """Flask-Login user loader backed by the user cache"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    if not current_app.config.get('USER_CACHE_ENABLED', True):
+        return db.session.get(User, user_id)
+
+    key = (user_id, _generations.get(user_id, 0), session.get(SESSION_VERSION_KEY, 0))
+    cache = _get_user_cache()
+    cached = cache.get(key)
+    if cached is None:
+        # An instance this request already loaded stays where it is
+        if db.session.identity_map.get(db.session.identity_key(User, user_id)) is not None:
+            return db.session.get(User, user_id)
+        user = db.session.get(User, user_id)
+        if user is None or user.is_admin:
+            return user
+        # Keep a detached copy for later requests and hand this request its own instance
+        db.session.expunge(user)
+        cache.set(key, user)
+        cached = user
+    return db.session.merge(cached, load=False)
+
+
+def invalidate_user(user_id):
+    """Drop cached copies of a user after their row changes"""
+    with _user_cache_lock:
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+    # Other processes still hold the old copy; a new session version makes the user's own requests miss there too
+    if has_request_context() and session.get('_user_id') == str(user_id):
+        session[SESSION_VERSION_KEY] = session.get(SESSION_VERSION_KEY, 0) + 1
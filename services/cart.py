@@ -0,0 +1,234 @@
+"""
+Server-side shopping carts.
+
+A cart belongs to the signed-in user or, before login, to a random token
+kept in the session cookie; `merge_session_cart()` folds the anonymous cart
+into the user's at login. `validate_lines()` re-checks a whole cart against
+the catalog with one `IN (...)` query over the products and their variants,
+returning the current price, stock and availability of every line, so
+client-held prices and stock never reach checkout unchecked.
+"""
+import secrets
+from datetime import datetime, timedelta
+
+from flask import session
+from flask_login import current_user
+from sqlalchemy import delete, select
+from sqlalchemy.orm import selectinload
+
+from models import db, Cart, CartItem, Product, ProductVariant
+from services.orders import MAX_LINE_ITEMS, MAX_QUANTITY, OrderError, parse_line_items
+
+SESSION_KEY = 'cart_token'
+
+
+def _key(product_id, size, color):
+    return (product_id, size, color)
+
+
+def parse_cart_items(items):
+    """Normalized cart lines; like order lines, but an empty cart is allowed and a client `price` is kept"""
+    if isinstance(items, list) and not items:
+        return []
+    lines = parse_line_items(items)
+    for line, item in zip(lines, items):
+        try:
+            line['price'] = float(item['price']) if item.get('price') is not None else None
+        except (TypeError, ValueError):
+            line['price'] = None
+    return lines
+
+
+def _load_catalog(product_ids):
+    """{product_id: product facts and {(size, color): stock} of its variants}, in one query"""
+    if not product_ids:
+        return {}
+    rows = db.session.execute(
+        select(Product.id, Product.name, Product.price, Product.stock, Product.image_url,
+               ProductVariant.size, ProductVariant.color, ProductVariant.stock)
+        .outerjoin(ProductVariant, ProductVariant.product_id == Product.id)
+        .where(Product.id.in_(product_ids))
+    ).all()
+    catalog = {}
+    for product_id, name, price, stock, image_url, size, color, variant_stock in rows:
+        product = catalog.setdefault(product_id, {
+            'name': name, 'price': price, 'stock': stock or 0, 'image_url': image_url, 'variants': {}
+        })
+        if variant_stock is not None:
+            product['variants'][(size, color)] = variant_stock
+    return catalog
+
+
+def _check_products(lines, catalog):
+    missing = sorted({line['product_id'] for line in lines} - catalog.keys())
+    if missing:
+        raise OrderError('Some products do not exist', status=404,
+                         details=[{'product_id': product_id} for product_id in missing])
+
+
+def _line_status(line, product):
+    # Products with variants can only be bought as one of them
+    if product['variants']:
+        stock = product['variants'].get((line['size'], line['color']))
+        if stock is None:
+            return 'unavailable', 0
+    else:
+        stock = product['stock']
+    if stock <= 0:
+        return 'out_of_stock', 0
+    if stock < line['quantity']:
+        return 'insufficient_stock', stock
+    return 'ok', stock
+
+
+def validate_lines(lines, catalog=None):
+    """Current price, stock and availability for every line, plus the totals of the available ones"""
+    if catalog is None:
+        catalog = _load_catalog({line['product_id'] for line in lines})
+    items = []
+    for line in lines:
+        item = {
+            'product_id': line['product_id'],
+            'size': line['size'],
+            'color': line['color'],
+            'quantity': line['quantity']
+        }
+        product = catalog.get(line['product_id'])
+        if product is None:
+            item.update(status='not_found', available=False, name=None, image_url=None, price=None, stock=0)
+        else:
+            status, stock = _line_status(line, product)
+            item.update(status=status, available=status == 'ok', name=product['name'],
+                        image_url=product['image_url'], price=product['price'], stock=stock)
+            if line.get('price') is not None:
+                item['price_changed'] = line['price'] != product['price']
+        items.append(item)
+    available = [item for item in items if item['available']]
+    return {
+        'items': items,
+        'valid': bool(items) and len(available) == len(items),
+        'item_count': sum(item['quantity'] for item in items),
+        'subtotal': round(sum(item['price'] * item['quantity'] for item in available), 2)
+    }
+
+
+def find_cart():
+    """The signed-in user's cart, or the session's anonymous one; None if there is none yet"""
+    query = Cart.query.options(selectinload(Cart.items))
+    if current_user.is_authenticated:
+        return query.filter_by(user_id=current_user.id).first()
+    token = session.get(SESSION_KEY)
+    return query.filter_by(session_token=token).first() if token else None
+
+
+def get_or_create_cart():
+    cart = find_cart()
+    if cart is None:
+        if current_user.is_authenticated:
+            cart = Cart(user_id=current_user.id)
+        else:
+            session[SESSION_KEY] = secrets.token_urlsafe(32)
+            cart = Cart(session_token=session[SESSION_KEY])
+        db.session.add(cart)
+    return cart
+
+
+def cart_lines(cart):
+    """A stored cart as lines for `validate_lines()`; `price` is the price when each line was added"""
+    if cart is None:
+        return []
+    return [
+        {'product_id': item.product_id, 'size': item.size, 'color': item.color,
+         'quantity': item.quantity, 'price': item.added_price}
+        for item in cart.items
+    ]
+
+
+def validated_cart(cart):
+    return validate_lines(cart_lines(cart))
+
+
+def _add_lines(cart, lines, catalog):
+    existing = {_key(item.product_id, item.size, item.color): item for item in cart.items}
+    for line in lines:
+        key = _key(line['product_id'], line['size'], line['color'])
+        item = existing.get(key)
+        if item is not None:
+            item.quantity = min(item.quantity + line['quantity'], MAX_QUANTITY)
+            continue
+        if len(existing) >= MAX_LINE_ITEMS:
+            raise OrderError(f'Carts are limited to {MAX_LINE_ITEMS} line items')
+        existing[key] = item = CartItem(
+            product_id=line['product_id'],
+            size=line['size'],
+            color=line['color'],
+            quantity=line['quantity'],
+            added_price=catalog[line['product_id']]['price']
+        )
+        cart.items.append(item)
+    cart.updated_at = datetime.utcnow()
+
+
+def add_items(cart, lines):
+    """Add `lines` to the cart, adding up quantities of lines it already has (caller commits)"""
+    catalog = _load_catalog({line['product_id'] for line in lines} | {item.product_id for item in cart.items})
+    _check_products(lines, catalog)
+    _add_lines(cart, lines, catalog)
+    return validate_lines(cart_lines(cart), catalog)
+
+
+def replace_items(cart, lines):
+    """Make the cart hold exactly `lines` (caller commits)"""
+    catalog = _load_catalog({line['product_id'] for line in lines})
+    _check_products(lines, catalog)
+    # Keep the price each line was first added at
+    added_prices = {_key(item.product_id, item.size, item.color): item.added_price for item in cart.items}
+    cart.items.clear()
+    _add_lines(cart, lines, catalog)
+    for item in cart.items:
+        item.added_price = added_prices.get(_key(item.product_id, item.size, item.color), item.added_price)
+    # Prices the client showed are what `price_changed` should compare against
+    client_prices = {_key(line['product_id'], line['size'], line['color']): line['price']
+                     for line in lines if line.get('price') is not None}
+    stored = cart_lines(cart)
+    for line in stored:
+        line['price'] = client_prices.get(_key(line['product_id'], line['size'], line['color']), line['price'])
+    return validate_lines(stored, catalog)
+
+
+def merge_session_cart(user):
+    """Fold the session's anonymous cart into `user`'s cart at login, then commit"""
+    token = session.pop(SESSION_KEY, None)
+    if not token:
+        return
+    anonymous = Cart.query.options(selectinload(Cart.items)).filter_by(session_token=token).first()
+    if anonymous is None:
+        return
+    cart = Cart.query.options(selectinload(Cart.items)).filter_by(user_id=user.id).first()
+    if cart is None:
+        # The anonymous cart simply becomes the user's
+        anonymous.session_token = None
+        anonymous.user_id = user.id
+    else:
+        existing = {_key(item.product_id, item.size, item.color): item for item in cart.items}
+        for item in anonymous.items:
+            key = _key(item.product_id, item.size, item.color)
+            if key in existing:
+                existing[key].quantity = min(existing[key].quantity + item.quantity, MAX_QUANTITY)
+            elif len(existing) < MAX_LINE_ITEMS:
+                existing[key] = CartItem(product_id=item.product_id, size=item.size, color=item.color,
+                                         quantity=item.quantity, added_price=item.added_price)
+                cart.items.append(existing[key])
+        cart.updated_at = datetime.utcnow()
+        db.session.delete(anonymous)
+    db.session.commit()
+
+
+def prune_anonymous_carts(days=30):
+    """Delete anonymous carts untouched for `days`; returns how many"""
+    stale = select(Cart.id).where(Cart.user_id.is_(None),
+                                  Cart.updated_at < datetime.utcnow() - timedelta(days=days))
+    db.session.execute(delete(CartItem).where(CartItem.cart_id.in_(stale)))
+    count = db.session.execute(delete(Cart).where(Cart.id.in_(stale))).rowcount
+    db.session.commit()
+    return count
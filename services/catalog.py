@@ -0,0 +1,174 @@
+"""
+Read-through cache for storefront catalog lookups.
+
+Categories, featured products and related products rarely change, so they
+are served from an in-process TTL/LRU cache and invalidated via
+`invalidate_catalog()` by the admin write paths, and by checkouts and order
+cancellations, which change stock.
+
+The catalog version that this and the page, API and facet caches are keyed
+on lives in `CATALOG_VERSION_FILE`, so a change committed by one server
+worker (or the job worker) invalidates the caches of every process on the
+host. `catalog_state()` reads the file at most once per request.
+
+Cached values are plain snapshots rather than ORM instances, so they can be
+shared between requests without being tied to any database session.
+"""
+import os
+import secrets
+import threading
+import time
+from types import SimpleNamespace
+
+from flask import current_app, g, has_request_context
+from sqlalchemy.orm import joinedload
+
+from models import Product, Category
+from services.cache import TTLCache
+
+_cache = None
+_cache_lock = threading.Lock()
+_version_lock = threading.Lock()
+
+# The version this process's caches were filled under; `updated_at` is a unix timestamp
+_state = SimpleNamespace(version='local', updated_at=time.time())
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLCache(
+                    maxsize=current_app.config.get('CATALOG_CACHE_SIZE', 512),
+                    ttl=current_app.config.get('CATALOG_CACHE_TTL', 300)
+                )
+    return _cache
+
+
+def _cached(key, loader):
+    if not current_app.config.get('CATALOG_CACHE_ENABLED', True):
+        return loader()
+    # Picks up a version bumped by another process, clearing stale lookups first
+    catalog_state()
+    return _get_cache().get_or_set(key, loader)
+
+
+def freeze_category(category):
+    return SimpleNamespace(
+        id=category.id,
+        name=category.name,
+        description=category.description,
+        image_url=category.image_url
+    )
+
+
+def freeze_product(product):
+    return SimpleNamespace(
+        id=product.id,
+        name=product.name,
+        description=product.description,
+        price=product.price,
+        stock=product.stock,
+        image_url=product.image_url,
+        sizes=product.sizes,
+        colors=product.colors,
+        category_id=product.category_id,
+        category=freeze_category(product.category) if product.category else None,
+        created_at=product.created_at
+    )
+
+
+def get_categories():
+    """All categories, in id order"""
+    return _cached('categories', lambda: [
+        freeze_category(category)
+        for category in Category.query.order_by(Category.id).all()
+    ])
+
+
+def get_featured_products(limit=8):
+    """Products shown on the home page"""
+    return _cached(('featured', limit), lambda: [
+        freeze_product(product)
+        for product in Product.query.options(joinedload(Product.category))
+        .order_by(Product.id).limit(limit).all()
+    ])
+
+
+def get_related_products(product, limit=4):
+    """Other products from the same category as `product`"""
+    def load():
+        related = Product.query.options(joinedload(Product.category)).filter(
+            Product.category_id == product.category_id,
+            Product.id != product.id
+        ).order_by(Product.id).limit(limit).all()
+        return [freeze_product(item) for item in related]
+
+    return _cached(('related', product.category_id, product.id, limit), load)
+
+
+def get_products(product_ids):
+    """Products by id, in the order given; ids that no longer exist are skipped"""
+    def load():
+        products = {
+            product.id: product
+            for product in Product.query.options(joinedload(Product.category))
+            .filter(Product.id.in_(product_ids)).all()
+        }
+        return [freeze_product(products[product_id]) for product_id in product_ids if product_id in products]
+
+    return _cached(('products', tuple(product_ids)), load)
+
+
+def _read_version(path):
+    try:
+        with open(path) as file:
+            version, updated_at = file.read().split()
+        return SimpleNamespace(version=version, updated_at=float(updated_at))
+    except (OSError, ValueError):
+        # Missing (or half-written by an older release): start a fresh version
+        return _write_version(path)
+
+
+def _write_version(path):
+    state = SimpleNamespace(version=secrets.token_hex(8), updated_at=time.time())
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}'
+    with open(temporary, 'w') as file:
+        file.write(f'{state.version} {state.updated_at}')
+    # Readers in other processes see either the old version or the new one, never a partial file
+    os.replace(temporary, path)
+    return state
+
+
+def _adopt(state):
+    """Make `state` this process's version, dropping lookups cached under an older one"""
+    global _state
+    with _version_lock:
+        if state.version != _state.version:
+            _state = state
+            if _cache is not None:
+                _cache.clear()
+    if has_request_context():
+        g.catalog_state = state
+    return state
+
+
+def catalog_state():
+    """The current catalog version and when it changed, as seen by every process"""
+    if has_request_context() and 'catalog_state' in g:
+        return g.catalog_state
+    path = current_app.config.get('CATALOG_VERSION_FILE')
+    if not path:
+        return _state
+    return _adopt(_read_version(path))
+
+
+def invalidate_catalog():
+    """Start a new catalog version after a product, category or stock change has been committed"""
+    path = current_app.config.get('CATALOG_VERSION_FILE')
+    if path:
+        _adopt(_write_version(path))
+    else:
+        _adopt(SimpleNamespace(version=secrets.token_hex(8), updated_at=time.time()))
@@ -0,0 +1,104 @@
+"""
+SQLite engine profile.
+
+File databases run in WAL mode with a busy timeout and tuned cache/mmap
+pragmas, so storefront reads no longer block behind admin writes. The
+default engine's pool has a connection per request or job thread, so routes
+that may write can still read concurrently; SQLite allows one writer at a
+time, so its connections open write transactions with `BEGIN IMMEDIATE`,
+which takes the write lock at the first INSERT/UPDATE/DELETE and waits for
+it under the busy timeout instead of failing mid-transaction. A second
+`reader` engine on the same file has a pool of `query_only` connections.
+GET requests to views marked `@read_only` send their queries to the reader
+engine for the whole request; flushes and INSERT/UPDATE/DELETE statements
+always go to the writer. In-memory databases keep Flask-SQLAlchemy's
+defaults.
+"""
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+READER_BIND = 'reader'
+
+
+def is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+        and url.query.get('mode') != 'memory'
+
+
+def engine_config(config):
+    """SQLALCHEMY_ENGINE_OPTIONS / SQLALCHEMY_BINDS for the configured database"""
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if not is_file_sqlite(uri):
+        return {}
+    pool_options = {'pool_timeout': config.get('DB_POOL_TIMEOUT', 30)}
+    settings = {
+        'SQLALCHEMY_ENGINE_OPTIONS': dict(
+            pool_options,
+            pool_size=config.get('DB_WRITER_POOL_SIZE', 8),
+            max_overflow=config.get('DB_WRITER_MAX_OVERFLOW', 4)
+        )
+    }
+    if config.get('DB_READ_ONLY_ROUTING', True):
+        settings['SQLALCHEMY_BINDS'] = dict(config.get('SQLALCHEMY_BINDS') or {}, **{
+            READER_BIND: dict(
+                pool_options,
+                url=uri,
+                pool_size=config.get('DB_READER_POOL_SIZE', 8),
+                max_overflow=config.get('DB_READER_MAX_OVERFLOW', 4)
+            )
+        })
+    return settings
+
+
+def _pragma_listener(config, read_only):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT', 5000))}")
+        cursor.execute(f"PRAGMA journal_mode = {config.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+        cursor.execute(f"PRAGMA synchronous = {config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+        cursor.execute(f"PRAGMA cache_size = {int(config.get('SQLITE_CACHE_SIZE', -16000))}")
+        cursor.execute(f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', 134217728))}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        else:
+            # pysqlite begins a transaction just before the first write; make it take the write lock
+            dbapi_connection.isolation_level = 'IMMEDIATE'
+        cursor.close()
+    return set_pragmas
+
+
+def install_sqlite_pragmas(app, db):
+    """Apply the pragmas to every new connection of the app's SQLite file engines"""
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            if is_file_sqlite(engine.url):
+                event.listen(engine, 'connect', _pragma_listener(app.config, bind_key == READER_BIND))
+
+
+class RoutingSession(Session):
+    """Session that reads from the reader engine while `info['read_only']` is set"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get('read_only') and not self._flushing \
+                and not isinstance(clause, UpdateBase):
+            reader = self._db.engines.get(READER_BIND)
+            if reader is not None:
+                return reader
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Mark a view whose GET requests can be served from the read-only pool"""
+    view.read_only = True
+    return view
+
+
+def route_read_only_requests():
+    """before_request hook: flag the session before anything (even the user loader) queries"""
+    view = current_app.view_functions.get(request.endpoint)
+    if request.method in ('GET', 'HEAD') and getattr(view, 'read_only', False):
+        current_app.extensions['sqlalchemy'].session.info['read_only'] = True
@@ -0,0 +1,122 @@
+"""
+Facet counts for the shop sidebar.
+
+For the current filter state, `get_facets()` returns product counts per
+category, per price bucket, per size and per color. Each facet is counted
+with every filter applied except its own (so picking "M" still shows how
+many products come in "L"), and all four GROUP BY queries run as a single
+UNION ALL statement. Results are cached per filter state until the catalog
+changes.
+"""
+import threading
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import String, case, cast, distinct, func, literal, union_all
+
+from models import db, Product, ProductVariant
+from services.cache import TTLCache
+from services.catalog import catalog_state, get_categories
+from services.listing import filtered_products
+
+# Upper bounds (₹) of the price histogram buckets; the last bucket is open-ended
+PRICE_BUCKETS = (500, 1000, 1500, 2500, 5000)
+SIZE_ORDER = ['XS', 'S', 'M', 'L', 'XL', 'XXL', 'XXXL']
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLCache(
+                    maxsize=current_app.config.get('FACET_CACHE_SIZE', 512),
+                    ttl=current_app.config.get('FACET_CACHE_TTL', 300)
+                )
+    return _cache
+
+
+def _without(filters, **cleared):
+    return SimpleNamespace(**dict(vars(filters), **cleared))
+
+
+def _price_bucket(bounds):
+    return case(*[(Product.price < bound, index) for index, bound in enumerate(bounds)], else_=len(bounds))
+
+
+def _variant_facet(filters, name, column, other_column, other_values):
+    """Products with an in-stock variant per value of `column`, honouring the other variant filter"""
+    conditions = [ProductVariant.stock > 0, column.isnot(None)]
+    if other_values:
+        conditions.append(other_column.in_(other_values))
+    return filtered_products(_without(filters, sizes=[], colors=[])) \
+        .join(ProductVariant, ProductVariant.product_id == Product.id) \
+        .filter(*conditions) \
+        .with_entities(literal(name).label('facet'), column.label('value'),
+                       func.count(distinct(Product.id)).label('count')) \
+        .group_by(column).order_by(None).statement
+
+
+def facet_statement(filters, bounds=PRICE_BUCKETS):
+    """One UNION ALL of the four facet GROUP BYs, yielding (facet, value, count) rows"""
+    bucket = _price_bucket(bounds)
+    categories = filtered_products(_without(filters, category_id=None)) \
+        .with_entities(literal('category').label('facet'), cast(Product.category_id, String).label('value'),
+                       func.count(Product.id).label('count')) \
+        .group_by(Product.category_id).order_by(None).statement
+    prices = filtered_products(_without(filters, min_price=None, max_price=None)) \
+        .with_entities(literal('price').label('facet'), cast(bucket, String).label('value'),
+                       func.count(Product.id).label('count')) \
+        .group_by(bucket).order_by(None).statement
+    sizes = _variant_facet(filters, 'size', ProductVariant.size, ProductVariant.color, filters.colors)
+    colors = _variant_facet(filters, 'color', ProductVariant.color, ProductVariant.size, filters.sizes)
+    return union_all(categories, prices, sizes, colors)
+
+
+def _size_key(size):
+    return (SIZE_ORDER.index(size), '') if size in SIZE_ORDER else (len(SIZE_ORDER), size)
+
+
+def compute_facets(filters):
+    bounds = current_app.config.get('FACET_PRICE_BUCKETS', PRICE_BUCKETS)
+    counts = {'category': {}, 'price': {}, 'size': {}, 'color': {}}
+    for facet, value, count in db.session.execute(facet_statement(filters, bounds)):
+        counts[facet][value] = count
+
+    prices = []
+    for index, lower in enumerate((0,) + tuple(bounds)):
+        upper = bounds[index] if index < len(bounds) else None
+        prices.append({
+            'min': lower,
+            'max': upper,
+            'count': counts['price'].get(str(index), 0),
+            'selected': filters.min_price == lower and filters.max_price == (upper - 0.01 if upper else None)
+        })
+
+    return {
+        'categories': [
+            {'id': category.id, 'name': category.name, 'count': counts['category'].get(str(category.id), 0),
+             'selected': filters.category_id == category.id}
+            for category in get_categories()
+        ],
+        'prices': prices,
+        'sizes': [{'value': size, 'count': counts['size'][size], 'selected': size in filters.sizes}
+                  for size in sorted(counts['size'], key=_size_key)],
+        'colors': [{'value': color, 'count': counts['color'][color], 'selected': color in filters.colors}
+                   for color in sorted(counts['color'])]
+    }
+
+
+def get_facets(filters):
+    """Facet counts for `filters` (from `listing_filters()`), cached until the catalog changes"""
+    # Facets are part of the catalog cache and switch off with it
+    if not current_app.config.get('CATALOG_CACHE_ENABLED', True):
+        return compute_facets(filters)
+    key = (
+        filters.category_id, filters.search, filters.min_price, filters.max_price,
+        tuple(sorted(filters.sizes)), tuple(sorted(filters.colors)), catalog_state().version
+    )
+    return _get_cache().get_or_set(key, lambda: compute_facets(filters))
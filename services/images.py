@@ -0,0 +1,150 @@
+"""
+Product image upload pipeline.
+
+Uploads are stored under a content hash (`<sha256[:16]>.<ext>`), so the same
+file is only ever stored once and its URL can be cached forever. Resized
+thumbnail, card and detail derivatives, each with a WebP twin, are generated
+by a background job (services/jobs.py) so the upload request only pays for
+writing the original. Templates pick a size with the `image_size` filter and fall back
+to the original until the derivative exists.
+
+Derivatives need Pillow; without it only the hashed original is stored.
+"""
+import hashlib
+import os
+import re
+
+from flask import current_app, request
+
+from services import jobs
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional
+    Image = None
+
+PRODUCT_IMAGE_URL = '/static/images/products/'
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'gif'}
+
+# Longest edge in pixels for each derivative
+SIZES = {
+    'thumb': 160,
+    'card': 480,
+    'detail': 1200,
+}
+
+IMMUTABLE_MAX_AGE = 31536000  # one year
+
+_HASHED_NAME_RE = re.compile(r'^([0-9a-f]{16})(?:-(?:%s))?\.(\w+)$' % '|'.join(SIZES))
+
+_ready = set()
+
+
+def _upload_folder():
+    return os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+
+
+def _derivative_format(ext):
+    return 'jpg' if ext in ('jpg', 'jpeg') else 'png'
+
+
+def derivative_name(digest, ext, size, fmt=None):
+    return f"{digest}-{size}.{fmt or _derivative_format(ext)}"
+
+
+def generate_derivatives(folder, digest, ext):
+    """Write every size (plus WebP) for an original; safe to run repeatedly"""
+    if Image is None:
+        return
+    source = os.path.join(folder, f"{digest}.{ext}")
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        for size, edge in SIZES.items():
+            image = original.copy()
+            image.thumbnail((edge, edge))
+            fmt = _derivative_format(ext)
+            if fmt == 'jpg' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            for target_fmt, options in ((fmt, {'optimize': True}),
+                                        ('webp', {'quality': 80, 'method': 4})):
+                if target_fmt == 'jpg':
+                    options = dict(options, quality=85, progressive=True)
+                name = derivative_name(digest, ext, size, target_fmt)
+                path = os.path.join(folder, name)
+                if not os.path.exists(path):
+                    # Write to a temp name first so readers never see a partial file
+                    tmp_path = f"{path}.tmp"
+                    image.save(tmp_path, format='JPEG' if target_fmt == 'jpg' else target_fmt.upper(), **options)
+                    os.replace(tmp_path, path)
+                _ready.add(name)
+
+
+@jobs.handler('images.derivatives')
+def _generate_derivatives_job(digest, ext):
+    generate_derivatives(_upload_folder(), digest, ext)
+
+
+def save_product_image(file):
+    """Store an uploaded image and queue its derivatives (committed with the caller's session).
+
+    Returns the image URL, or None if the file type is not allowed.
+    """
+    ext = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        return None
+    ext = 'jpg' if ext == 'jpeg' else ext
+
+    data = file.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    folder = _upload_folder()
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{digest}.{ext}")
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    if Image is not None:
+        jobs.enqueue('images.derivatives', digest=digest, ext=ext)
+    return f"{PRODUCT_IMAGE_URL}{digest}.{ext}"
+
+
+def image_size(image_url, size, fmt=None):
+    """Template filter: URL of the `size` derivative of a product image.
+
+    Pass fmt='webp' for the WebP twin. Images that were not uploaded through
+    the pipeline, or whose derivatives are not ready yet, keep their
+    original URL (or None for WebP, so templates can skip the <source>).
+    """
+    fallback = None if fmt == 'webp' else image_url
+    if not image_url or not image_url.startswith(PRODUCT_IMAGE_URL):
+        return fallback
+    match = _HASHED_NAME_RE.match(image_url[len(PRODUCT_IMAGE_URL):])
+    if not match or size not in SIZES:
+        return fallback
+
+    digest, ext = match.groups()
+    name = derivative_name(digest, ext, size, fmt)
+    if name not in _ready:
+        if not os.path.exists(os.path.join(_upload_folder(), name)):
+            return fallback
+        _ready.add(name)
+    return f"{PRODUCT_IMAGE_URL}{name}"
+
+
+def is_content_hashed(filename):
+    """True for upload originals and derivatives named by the pipeline"""
+    return bool(_HASHED_NAME_RE.match(filename))
+
+
+def add_image_cache_headers(response):
+    """Content-hashed product images never change, so let browsers keep them"""
+    path = request.path
+    if (response.status_code == 200 and path.startswith(PRODUCT_IMAGE_URL)
+            and is_content_hashed(path[len(PRODUCT_IMAGE_URL):])):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
@@ -0,0 +1,184 @@
+"""
+Durable background jobs in the app's own SQLite database.
+
+`enqueue()` adds a row to the `job` table in the caller's session, so a job
+is committed together with the change that caused it (or not at all).
+Workers claim the oldest visible job by pushing its `visible_at` forward by
+the visibility timeout; a worker that dies mid-job leaves it to reappear and
+be retried once the timeout passes. A handler runs in the same transaction
+that deletes its job, so its database writes and the job's completion commit
+together. Failures are retried with exponential backoff until
+`max_attempts`, then kept with status `failed` for `flask jobs-status` and
+`flask jobs-retry`.
+
+Jobs run on `JOBS_WORKERS` threads started in each server process
+(`start_workers()`, file databases only), on a separate `flask jobs-worker`
+process, or both.
+"""
+import json
+import os
+import random
+import signal
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select, update
+
+from models import db, Job
+from services.database import is_file_sqlite
+
+_handlers = {}
+_wakeup = threading.Event()
+_workers_lock = threading.Lock()
+_workers_pid = None
+
+
+def handler(name):
+    """Register a function as the handler for jobs called `name`; it gets the payload as keyword arguments"""
+    def register(function):
+        _handlers[name] = function
+        return function
+    return register
+
+
+def enqueue(name, delay=0, max_attempts=None, **payload):
+    """Queue a job in the current session; it becomes runnable when the caller commits"""
+    db.session.add(Job(
+        name=name,
+        payload=json.dumps(payload),
+        max_attempts=max_attempts or current_app.config.get('JOBS_MAX_ATTEMPTS', 5),
+        visible_at=datetime.utcnow() + timedelta(seconds=delay)
+    ))
+    _wakeup.set()
+
+
+def _backoff(attempts):
+    config = current_app.config
+    delay = min(config.get('JOBS_BACKOFF_BASE', 10) * 2 ** (attempts - 1), config.get('JOBS_BACKOFF_MAX', 3600))
+    return delay * random.uniform(1, 1.25)
+
+
+def _claim():
+    """Hide the next visible job from other workers; returns it, or None when there is none"""
+    now = datetime.utcnow()
+    job_id = db.session.execute(
+        select(Job.id).where(Job.status == 'queued', Job.visible_at <= now)
+        .order_by(Job.visible_at).limit(1)
+    ).scalar()
+    if job_id is None:
+        db.session.rollback()
+        return None
+    # Only one worker's conditional update matches; the others see rowcount 0
+    claimed = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'queued', Job.visible_at <= now).values(
+            visible_at=now + timedelta(seconds=current_app.config.get('JOBS_VISIBILITY_TIMEOUT', 300)),
+            attempts=Job.attempts + 1
+        )
+    ).rowcount
+    db.session.commit()
+    return db.session.get(Job, job_id) if claimed else None
+
+
+def _record_failure(job_id, error):
+    job = db.session.get(Job, job_id)
+    job.last_error = f"{type(error).__name__}: {error}"[:2000]
+    if job.attempts >= job.max_attempts:
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+        current_app.logger.error('Job %s (%s) failed after %d attempts: %s',
+                                 job.id, job.name, job.attempts, job.last_error)
+    else:
+        job.visible_at = datetime.utcnow() + timedelta(seconds=_backoff(job.attempts))
+        current_app.logger.warning('Job %s (%s) attempt %d failed, retrying at %s: %s',
+                                   job.id, job.name, job.attempts, job.visible_at, job.last_error)
+    db.session.commit()
+
+
+def run_next_job():
+    """Claim and run one job; returns False when the queue had nothing visible"""
+    job = _claim()
+    if job is None:
+        return False
+    job_id = job.id
+    try:
+        function = _handlers.get(job.name)
+        if function is None:
+            raise LookupError(f"no handler registered for {job.name!r}")
+        function(**json.loads(job.payload))
+        db.session.delete(job)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _record_failure(job_id, e)
+    return True
+
+
+def run_worker(app, stop):
+    """Run jobs until `stop` is set, sleeping up to JOBS_POLL_INTERVAL while the queue is empty"""
+    interval = app.config.get('JOBS_POLL_INTERVAL', 1.0)
+    while not stop.is_set():
+        with app.app_context():
+            try:
+                ran = run_next_job()
+            except Exception:
+                app.logger.exception('Job worker error')
+                ran = False
+        if not ran:
+            _wakeup.wait(interval)
+            _wakeup.clear()
+
+
+def start_workers(app):
+    """Start JOBS_WORKERS daemon threads in this process, once per process"""
+    global _workers_pid
+    count = app.config.get('JOBS_WORKERS', 2)
+    # In-memory databases share one connection between threads, so they get no workers
+    if count <= 0 or _workers_pid == os.getpid() or not is_file_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        # Recorded by pid so a forked server worker starts its own threads
+        _workers_pid = os.getpid()
+        stop = threading.Event()
+        for index in range(count):
+            threading.Thread(target=run_worker, args=(app, stop), name=f'job-worker-{index}', daemon=True).start()
+
+
+def serve(app, threads):
+    """Run jobs on `threads` threads until interrupted; used by `flask jobs-worker`"""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    workers = [threading.Thread(target=run_worker, args=(app, stop), name=f'job-worker-{index}')
+               for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    try:
+        while not stop.is_set():
+            stop.wait(1)
+    except KeyboardInterrupt:
+        stop.set()
+    _wakeup.set()
+    for worker in workers:
+        worker.join()
+
+
+def job_counts():
+    """{status: count} of the jobs in the table"""
+    return dict(db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+
+
+def failed_jobs(limit=20):
+    return Job.query.filter_by(status='failed').order_by(Job.finished_at.desc()).limit(limit).all()
+
+
+def retry_failed():
+    """Queue every failed job again with a fresh set of attempts; returns how many"""
+    count = db.session.execute(
+        update(Job).where(Job.status == 'failed').values(
+            status='queued', attempts=0, visible_at=datetime.utcnow(), finished_at=None
+        )
+    ).rowcount
+    db.session.commit()
+    return count
@@ -0,0 +1,60 @@
+"""
+Product listing filters shared by the shop page and the JSON API.
+
+`listing_filters()` reads the shop's query-string arguments, and
+`filtered_products()` / `listing_order()` turn them into the product query
+and keyset sort keys, so every view that lists products filters and sorts
+them the same way.
+"""
+from types import SimpleNamespace
+
+from models import Product
+from services import search as search_index
+from services.variants import filter_by_variant
+
+
+def listing_filters(args):
+    """Filters from a request's query string (category, search, sort, price range, sizes, colors)"""
+    return SimpleNamespace(
+        category_id=args.get('category', type=int),
+        search=args.get('search', ''),
+        sort_by=args.get('sort', ''),
+        min_price=args.get('min_price', type=float),
+        max_price=args.get('max_price', type=float),
+        sizes=[size for size in args.getlist('size') if size],
+        colors=[color for color in args.getlist('color') if color]
+    )
+
+
+def filtered_products(filters, query=None):
+    """`query` (all products by default) narrowed by `filters`"""
+    query = Product.query if query is None else query
+
+    if filters.category_id:
+        query = query.filter(Product.category_id == filters.category_id)
+
+    if filters.search:
+        query = search_index.filter_products(query, filters.search, ranked=False)
+
+    if filters.min_price is not None:
+        query = query.filter(Product.price >= filters.min_price)
+
+    if filters.max_price is not None:
+        query = query.filter(Product.price <= filters.max_price)
+
+    # Size/color filters match in-stock variants via the variant indexes
+    return filter_by_variant(query, filters.sizes, filters.colors)
+
+
+def listing_order(filters):
+    """Sort keys as (column, descending); the trailing id keeps positions unique"""
+    if filters.sort_by == 'name':
+        return [(Product.name, False), (Product.id, False)]
+    if filters.sort_by == 'price_low':
+        return [(Product.price, False), (Product.id, False)]
+    if filters.sort_by == 'price_high':
+        return [(Product.price, True), (Product.id, True)]
+    if filters.search and filters.sort_by != 'newest':
+        # Search results without an explicit sort are ranked by relevance
+        return search_index.relevance_order(filters.search)
+    return [(Product.id, True)]
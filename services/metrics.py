@@ -0,0 +1,255 @@
+"""
+Request instrumentation.
+
+Every request records its total time, template render time and the number
+and cumulative time of its SQL statements (from engine events). The numbers
+are sent back in a `Server-Timing` header and folded into per-endpoint
+histograms that `/metrics` exposes in the Prometheus text format. The
+bookkeeping is a few counters per request, so it can stay on in production.
+
+Each process also writes its totals to a file of its own in `METRICS_DIR`,
+at most every `METRICS_FLUSH_INTERVAL` seconds from a background thread,
+and `/metrics` sums the files of every process, so a scrape answered by any
+gunicorn worker covers all of them. Files of workers that have exited are
+kept, so the totals never go backwards; wsgi.py clears the directory when
+the server starts.
+"""
+import glob
+import json
+import os
+import secrets
+import threading
+import time
+
+from flask import Response, abort, before_render_template, current_app, g, has_request_context, request, \
+    template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label value"""
+
+    def __init__(self):
+        self.series = {}
+
+    def observe(self, label, value):
+        counts, total, observed = self.series.get(label, ([0] * len(BUCKETS), 0.0, 0))
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                counts[index] += 1
+        self.series[label] = (counts, total + value, observed + 1)
+
+    def merge(self, series):
+        """Add another process's `series` to this one"""
+        for label, (counts, total, observed) in series.items():
+            own_counts, own_total, own_observed = self.series.get(label, ([0] * len(BUCKETS), 0.0, 0))
+            self.series[label] = ([a + b for a, b in zip(own_counts, counts)], own_total + total,
+                                  own_observed + observed)
+
+    def render(self, name, help_text):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for label, (counts, total, observed) in sorted(self.series.items()):
+            for bound, count in zip(BUCKETS, counts):
+                lines.append(f'{name}_bucket{{endpoint="{label}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{endpoint="{label}",le="+Inf"}} {observed}')
+            lines.append(f'{name}_sum{{endpoint="{label}"}} {total:.6f}')
+            lines.append(f'{name}_count{{endpoint="{label}"}} {observed}')
+        return lines
+
+
+_lock = threading.Lock()
+_statements = {}
+_responses = {}
+_request_seconds = Histogram()
+_sql_seconds = Histogram()
+_render_seconds = Histogram()
+_HISTOGRAMS = {'request': _request_seconds, 'sql': _sql_seconds, 'render': _render_seconds}
+
+# This process's snapshot file and flusher thread, recreated after a fork
+_flusher_lock = threading.Lock()
+_flusher = {'pid': None, 'path': None, 'dirty': threading.Event()}
+
+
+def _enabled():
+    return current_app.config.get('METRICS_ENABLED', True)
+
+
+def start_request_timer():
+    """before_request hook; register it first so it also times the other hooks"""
+    if _enabled():
+        g.metrics = {'started': time.perf_counter(), 'sql_count': 0, 'sql_time': 0.0,
+                     'render_time': 0.0, 'render_started': []}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics' in g:
+        conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_query_started')
+    if started and has_request_context() and 'metrics' in g:
+        g.metrics['sql_count'] += 1
+        g.metrics['sql_time'] += time.perf_counter() - started.pop()
+
+
+def _before_render(sender, template, context, **extra):
+    if 'metrics' in g:
+        g.metrics['render_started'].append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    if 'metrics' in g and g.metrics['render_started']:
+        started = g.metrics['render_started'].pop()
+        # Only count the outermost render so includes are not double counted
+        if not g.metrics['render_started']:
+            g.metrics['render_time'] += time.perf_counter() - started
+
+
+def install_timing_listeners(app, db):
+    """Time SQL statements on every engine and template renders of `app`"""
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+
+def record_request(response):
+    """after_request hook: add Server-Timing and update the histograms"""
+    metrics = g.pop('metrics', None)
+    if metrics is None:
+        return response
+    total = time.perf_counter() - metrics['started']
+    endpoint = request.endpoint or 'unmatched'
+
+    if current_app.config.get('SERVER_TIMING_ENABLED', True):
+        response.headers.add('Server-Timing', ', '.join([
+            f"app;dur={total * 1000:.2f}",
+            f'db;dur={metrics["sql_time"] * 1000:.2f};desc="{metrics["sql_count"]} queries"',
+            f"tpl;dur={metrics['render_time'] * 1000:.2f}"
+        ]))
+
+    with _lock:
+        _statements[endpoint] = _statements.get(endpoint, 0) + metrics['sql_count']
+        status_key = (endpoint, response.status_code)
+        _responses[status_key] = _responses.get(status_key, 0) + 1
+        _request_seconds.observe(endpoint, total)
+        _sql_seconds.observe(endpoint, metrics['sql_time'])
+        _render_seconds.observe(endpoint, metrics['render_time'])
+    if current_app.config.get('METRICS_DIR'):
+        _start_flusher(current_app.config)
+        _flusher['dirty'].set()
+    return response
+
+
+def _snapshot():
+    """This process's totals as plain JSON-friendly data"""
+    with _lock:
+        return {
+            'statements': dict(_statements),
+            'responses': [[endpoint, status, count] for (endpoint, status), count in _responses.items()],
+            'histograms': {
+                name: {label: [list(counts), total, observed]
+                       for label, (counts, total, observed) in histogram.series.items()}
+                for name, histogram in _HISTOGRAMS.items()
+            }
+        }
+
+
+def _flush():
+    """Write this process's snapshot to its file in METRICS_DIR"""
+    with _flusher_lock:
+        _flusher['dirty'].clear()
+        path = _flusher['path']
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(_snapshot(), file)
+        # Readers see the previous snapshot or this one, never a partial file
+        os.replace(f'{path}.tmp', path)
+
+
+def _flush_loop(interval):
+    while True:
+        _flusher['dirty'].wait()
+        _flush()
+        time.sleep(interval)
+
+
+def _start_flusher(config):
+    """Start this process's flusher thread, once per process"""
+    if _flusher['pid'] == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher['pid'] == os.getpid():
+            return
+        os.makedirs(config['METRICS_DIR'], exist_ok=True)
+        # A new name per process start, so a reused pid never overwrites an exited worker's totals
+        _flusher['path'] = os.path.join(config['METRICS_DIR'], f'{os.getpid()}-{secrets.token_hex(4)}.json')
+        _flusher['dirty'] = threading.Event()
+        _flusher['pid'] = os.getpid()
+        threading.Thread(target=_flush_loop, args=(config.get('METRICS_FLUSH_INTERVAL', 1.0),),
+                         name='metrics-flusher', daemon=True).start()
+
+
+def clear_metrics_dir(app):
+    """Delete the snapshot files of a previous server run"""
+    directory = app.config.get('METRICS_DIR')
+    for path in glob.glob(os.path.join(directory, '*.json')) if directory else []:
+        os.remove(path)
+
+
+def _snapshots(directory):
+    """This process's snapshot, or those of every process that wrote one to `directory`"""
+    if not directory:
+        return [_snapshot()]
+    if _flusher['pid'] == os.getpid():
+        _flush()
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def render_metrics():
+    """Prometheus text exposition of everything recorded so far, by every process when METRICS_DIR is set"""
+    statements, responses = {}, {}
+    histograms = {name: Histogram() for name in _HISTOGRAMS}
+    for snapshot in _snapshots(current_app.config.get('METRICS_DIR')):
+        for endpoint, count in snapshot['statements'].items():
+            statements[endpoint] = statements.get(endpoint, 0) + count
+        for endpoint, status, count in snapshot['responses']:
+            responses[(endpoint, status)] = responses.get((endpoint, status), 0) + count
+        for name, series in snapshot['histograms'].items():
+            histograms[name].merge(series)
+
+    lines = []
+    lines += histograms['request'].render('zeecloths_request_duration_seconds', 'Total request time')
+    lines += histograms['sql'].render('zeecloths_request_sql_duration_seconds', 'SQL time per request')
+    lines += histograms['render'].render('zeecloths_request_render_duration_seconds', 'Template render time per request')
+    lines += ['# HELP zeecloths_sql_statements_total SQL statements executed',
+              '# TYPE zeecloths_sql_statements_total counter']
+    lines += [f'zeecloths_sql_statements_total{{endpoint="{endpoint}"}} {count}'
+              for endpoint, count in sorted(statements.items())]
+    lines += ['# HELP zeecloths_responses_total Responses by status code',
+              '# TYPE zeecloths_responses_total counter']
+    lines += [f'zeecloths_responses_total{{endpoint="{endpoint}",status="{status}"}} {count}'
+              for (endpoint, status), count in sorted(responses.items())]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    """GET /metrics: admins, or scrapers on the same host when METRICS_ALLOW_LOCALHOST is set"""
+    local = current_app.config.get('METRICS_ALLOW_LOCALHOST', False) and request.remote_addr in LOCAL_ADDRESSES
+    if not local and not (current_user.is_authenticated and current_user.is_admin):
+        abort(404)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,81 @@
+"""
+Versioned schema migrations.
+
+`db.create_all()` only creates missing tables, so changes to existing
+tables (new indexes, columns) and one-off data backfills are written here as
+numbered migrations and applied in order against a live database with
+`flask db-upgrade`. Applied versions are recorded in the `schema_version`
+table; each migration runs in its own transaction and must be safe on a
+database that `create_all()` just built from the current models (hence
+`IF NOT EXISTS`).
+"""
+from sqlalchemy import select, text
+
+from models import db, ProductVariant, SchemaVersion
+from services.variants import combinations, distribute_stock, parse_options
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a migration function taking a Connection"""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return register
+
+
+@migration(1, 'Secondary indexes for catalog and order queries')
+def add_query_indexes(conn):
+    for statement in (
+        'CREATE INDEX IF NOT EXISTS ix_product_category_price ON product (category_id, price)',
+        'CREATE INDEX IF NOT EXISTS ix_product_price ON product (price)',
+        'CREATE INDEX IF NOT EXISTS ix_product_name ON product (name)',
+        'CREATE INDEX IF NOT EXISTS ix_order_user_created ON "order" (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_order_status_created ON "order" (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_order_created_at ON "order" (created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_order_item_order ON order_item (order_id)',
+        'CREATE INDEX IF NOT EXISTS ix_order_item_product ON order_item (product_id)',
+    ):
+        conn.execute(text(statement))
+
+
+@migration(2, 'Product variants from the legacy sizes/colors JSON columns')
+def backfill_product_variants(conn):
+    # Same result as `flask migrate-variants`: stock spread evenly over every size/color pair
+    products = conn.execute(text(
+        'SELECT id, stock, sizes, colors FROM product WHERE NOT EXISTS '
+        '(SELECT 1 FROM product_variant WHERE product_variant.product_id = product.id)'
+    )).all()
+    for product_id, stock, sizes, colors in products:
+        pairs = combinations(parse_options(sizes), parse_options(colors))
+        conn.execute(ProductVariant.__table__.insert(), [
+            {'product_id': product_id, 'size': size, 'color': color, 'stock': variant_stock}
+            for (size, color), variant_stock in zip(pairs, distribute_stock(stock, len(pairs)))
+        ])
+
+
+def applied_versions():
+    schema_version = SchemaVersion.__table__
+    schema_version.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return {version for (version,) in conn.execute(select(schema_version.c.version))}
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [entry for entry in MIGRATIONS if entry[0] not in applied]
+
+
+def upgrade(target=None):
+    """Apply pending migrations up to `target` (default: all); returns those applied"""
+    applied = []
+    for version, description, func in pending_migrations():
+        if target is not None and version > target:
+            break
+        with db.engine.begin() as conn:
+            func(conn)
+            conn.execute(SchemaVersion.__table__.insert().values(version=version, description=description))
+        applied.append((version, description))
+    return applied
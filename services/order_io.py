@@ -0,0 +1,99 @@
+"""
+Order export.
+
+Orders matching a date range and status are streamed with their line items
+as CSV (one line per item, order columns repeated) or JSONL (one object per
+order). The query runs with `yield_per`, so rows are fetched from the cursor
+in batches; each batch gets its customers joined in and its items (with
+product names) loaded by one extra SELECT. Orders are only held while their
+batch is written, so memory use does not grow with the size of the export.
+"""
+import csv
+import io
+import json
+from datetime import timedelta
+
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, Order, OrderItem, Product
+
+ORDER_STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+ORDER_FIELDS = ['order_number', 'created_at', 'status', 'customer_email', 'customer_name',
+                'payment_method', 'total_amount', 'shipping_address', 'billing_address']
+ITEM_FIELDS = ['product_id', 'product_name', 'size', 'color', 'quantity', 'price', 'line_total']
+YIELD_PER = 500
+
+
+def _order_query(start=None, end=None, status=None):
+    """Orders created on or after `start` and on or before the day `end`, oldest first"""
+    query = select(Order).options(
+        joinedload(Order.user),
+        selectinload(Order.items).joinedload(OrderItem.product).load_only(Product.name)
+    )
+    if start is not None:
+        query = query.where(Order.created_at >= start)
+    if end is not None:
+        query = query.where(Order.created_at < end + timedelta(days=1))
+    if status:
+        query = query.where(Order.status == status)
+    return query.order_by(Order.created_at, Order.id).execution_options(yield_per=YIELD_PER)
+
+
+def _order_row(order):
+    return {
+        'order_number': order.order_number,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'status': order.status,
+        'customer_email': order.user.email,
+        'customer_name': f"{order.user.first_name} {order.user.last_name}",
+        'payment_method': order.payment_method,
+        'total_amount': order.total_amount,
+        'shipping_address': order.shipping_address,
+        'billing_address': order.billing_address
+    }
+
+
+def _item_row(item):
+    return {
+        'product_id': item.product_id,
+        'product_name': item.product.name if item.product else None,
+        'size': item.size,
+        'color': item.color,
+        'quantity': item.quantity,
+        'price': item.price,
+        'line_total': round(item.price * item.quantity, 2)
+    }
+
+
+def _order_batches(start, end, status):
+    """Yield the matching orders one `yield_per` batch at a time"""
+    result = db.session.scalars(_order_query(start, end, status))
+    try:
+        for batch in result.partitions():
+            yield batch
+    finally:
+        result.close()
+
+
+def export_orders(file_format, start=None, end=None, status=None):
+    """Generator of CSV or JSONL text for the matching orders and their items"""
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=ORDER_FIELDS + ITEM_FIELDS)
+        writer.writeheader()
+        for batch in _order_batches(start, end, status):
+            for order in batch:
+                order_row = _order_row(order)
+                for item in order.items or [None]:
+                    writer.writerow(dict(order_row, **_item_row(item)) if item else order_row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for batch in _order_batches(start, end, status):
+            yield ''.join(
+                json.dumps(dict(_order_row(order), items=[_item_row(item) for item in order.items])) + '\n'
+                for order in batch
+            )
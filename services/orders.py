@@ -0,0 +1,273 @@
+"""
+Order creation.
+
+An order is written in a single transaction: every line item (product and
+size/color variant) is validated with one query, stock is decremented with
+conditional UPDATEs (so two concurrent checkouts can never oversell), and
+the order items are inserted in bulk. Once it commits the catalog version
+is bumped, since cached pages and API payloads show stock. An optional
+idempotency key lets clients retry safely. Cancelling an order puts its
+items back in stock in the same transaction as the status change.
+"""
+from sqlalchemy import and_, bindparam, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, Product, ProductVariant, Order, OrderItem, IdempotencyKey
+from services import jobs, rollups, stats
+from services.catalog import invalidate_catalog
+
+MAX_LINE_ITEMS = 100
+MAX_QUANTITY = 1000
+
+
+class OrderError(Exception):
+    """Raised when an order cannot be placed; `status` is the HTTP status to use"""
+
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.details = details or []
+
+
+def parse_line_items(items):
+    """Validate the raw `items` payload and return normalized line dicts"""
+    if not isinstance(items, list) or not items:
+        raise OrderError('Order must contain at least one item')
+    if len(items) > MAX_LINE_ITEMS:
+        raise OrderError(f'Orders are limited to {MAX_LINE_ITEMS} line items')
+
+    lines = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise OrderError(f'Item {index} must be an object')
+        product_id = item.get('product_id')
+        quantity = item.get('quantity', 1)
+        # No coercion: True, 1.9 or "3" is a malformed payload, not a quantity of 1 or 3
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in (product_id, quantity)):
+            raise OrderError(f'Item {index} has an invalid product_id or quantity')
+        if quantity < 1 or quantity > MAX_QUANTITY:
+            raise OrderError(f'Item {index} quantity must be between 1 and {MAX_QUANTITY}')
+        lines.append({
+            'product_id': product_id,
+            'quantity': quantity,
+            'size': str(item['size']) if item.get('size') else None,
+            'color': str(item['color']) if item.get('color') else None
+        })
+    return lines
+
+
+def order_detail_options():
+    """Loader options for pages that walk order.user, order.items and item.product"""
+    return (
+        joinedload(Order.user),
+        selectinload(Order.items).joinedload(OrderItem.product)
+    )
+
+
+def find_idempotent_order(user_id, key):
+    """Return the order previously created for this user and key, if any"""
+    record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+    return record.order if record else None
+
+
+def _stock_shortages(model, quantities):
+    rows = db.session.execute(
+        select(model.id, model.stock).where(model.id.in_(quantities))
+    ).all()
+    key = 'product_id' if model is Product else 'variant_id'
+    return [
+        {key: row_id, 'requested': quantities[row_id], 'available': stock or 0}
+        for row_id, stock in rows
+        if (stock or 0) < quantities[row_id]
+    ]
+
+
+def _decrement_stock(model, quantities):
+    """Take `quantities` ({id: qty}) off `model.stock`; False if any row is short"""
+    if not quantities:
+        return True
+    table = model.__table__
+    decrement = update(table).where(
+        table.c.id == bindparam('b_id'),
+        table.c.stock >= bindparam('b_quantity')
+    ).values(stock=table.c.stock - bindparam('b_quantity'))
+    result = db.session.connection().execute(decrement, [
+        {'b_id': row_id, 'b_quantity': quantity}
+        for row_id, quantity in quantities.items()
+    ])
+    return result.rowcount == len(quantities)
+
+
+def create_order(user, items, payment_method=None, shipping_address=None,
+                 billing_address=None, idempotency_key=None):
+    """Place an order for `user`.
+
+    Returns `(order, created)`; `created` is False when `idempotency_key`
+    matched an earlier order, which is returned unchanged.
+    """
+    if idempotency_key:
+        existing = find_idempotent_order(user.id, idempotency_key)
+        if existing:
+            return existing, False
+
+    lines = parse_line_items(items)
+
+    # Validate every product and variant and fetch current prices in one query
+    product_ids = {line['product_id'] for line in lines}
+    rows = db.session.execute(
+        select(Product.id, Product.price, ProductVariant.id, ProductVariant.size, ProductVariant.color)
+        .outerjoin(ProductVariant, ProductVariant.product_id == Product.id)
+        .where(Product.id.in_(product_ids))
+    ).all()
+    prices = {}
+    variant_ids = {}
+    for product_id, price, variant_id, size, color in rows:
+        prices[product_id] = price
+        if variant_id is not None:
+            variant_ids[(product_id, size, color)] = variant_id
+
+    missing = sorted(product_ids - prices.keys())
+    if missing:
+        raise OrderError('Some products do not exist', status=404,
+                         details=[{'product_id': product_id} for product_id in missing])
+
+    # Products with variants must be bought as one of them
+    with_variants = {product_id for product_id, _, _ in variant_ids}
+    unavailable = [
+        {'product_id': line['product_id'], 'size': line['size'], 'color': line['color']}
+        for line in lines
+        if line['product_id'] in with_variants
+        and (line['product_id'], line['size'], line['color']) not in variant_ids
+    ]
+    if unavailable:
+        raise OrderError('Some size/color combinations are not available', status=409,
+                         details=unavailable)
+
+    quantities = {}
+    variant_quantities = {}
+    for line in lines:
+        quantities[line['product_id']] = quantities.get(line['product_id'], 0) + line['quantity']
+        variant_id = variant_ids.get((line['product_id'], line['size'], line['color']))
+        if variant_id is not None:
+            variant_quantities[variant_id] = variant_quantities.get(variant_id, 0) + line['quantity']
+
+    try:
+        # Conditional decrements: a row only changes if enough stock remains
+        if variant_quantities and not _decrement_stock(ProductVariant, variant_quantities):
+            db.session.rollback()
+            raise OrderError('Insufficient stock', status=409,
+                             details=_stock_shortages(ProductVariant, variant_quantities))
+        if not _decrement_stock(Product, quantities):
+            db.session.rollback()
+            raise OrderError('Insufficient stock', status=409,
+                             details=_stock_shortages(Product, quantities))
+
+        total_amount = round(sum(prices[line['product_id']] * line['quantity'] for line in lines), 2)
+        order = Order(
+            user_id=user.id,
+            total_amount=total_amount,
+            payment_method=payment_method,
+            shipping_address=shipping_address,
+            billing_address=billing_address or shipping_address
+        )
+        db.session.add(order)
+        db.session.flush()
+
+        db.session.execute(insert(OrderItem), [
+            {
+                'order_id': order.id,
+                'product_id': line['product_id'],
+                'quantity': line['quantity'],
+                'price': prices[line['product_id']],
+                'size': line['size'],
+                'color': line['color']
+            }
+            for line in lines
+        ])
+
+        rollups.record_order(order, items_sold=sum(line['quantity'] for line in lines))
+        if len(product_ids) > 1:
+            # Pair counting is O(n²) upserts; keep it out of the checkout's write lock
+            jobs.enqueue('recommendations.record_order', product_ids=sorted(product_ids))
+
+        if idempotency_key:
+            db.session.add(IdempotencyKey(key=idempotency_key, user_id=user.id, order_id=order.id))
+
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key won the race
+        db.session.rollback()
+        existing = find_idempotent_order(user.id, idempotency_key) if idempotency_key else None
+        if existing:
+            return existing, False
+        raise
+
+    # Cached product pages, API payloads and in-stock facets show the old stock until the version moves
+    invalidate_catalog()
+    stats.record_order_created(order)
+    return order, True
+
+
+def _increment_stock(model, quantities):
+    """Put `quantities` ({id: qty}) back on `model.stock`"""
+    if not quantities:
+        return
+    table = model.__table__
+    increment = update(table).where(table.c.id == bindparam('b_id')) \
+        .values(stock=table.c.stock + bindparam('b_quantity'))
+    db.session.connection().execute(increment, [
+        {'b_id': row_id, 'b_quantity': quantity}
+        for row_id, quantity in quantities.items()
+    ])
+
+
+def _order_quantities(order_id):
+    """({product_id: qty}, {variant_id: qty}) of an order's items"""
+    rows = db.session.execute(
+        select(OrderItem.product_id, ProductVariant.id, func.sum(OrderItem.quantity))
+        .outerjoin(ProductVariant, and_(
+            ProductVariant.product_id == OrderItem.product_id,
+            ProductVariant.size.is_not_distinct_from(OrderItem.size),
+            ProductVariant.color.is_not_distinct_from(OrderItem.color)
+        ))
+        .where(OrderItem.order_id == order_id)
+        .group_by(OrderItem.product_id, ProductVariant.id)
+    ).all()
+    quantities = {}
+    variant_quantities = {}
+    for product_id, variant_id, quantity in rows:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+        if variant_id is not None:
+            variant_quantities[variant_id] = quantity
+    return quantities, variant_quantities
+
+
+def change_order_status(order, new_status):
+    """Move `order` to `new_status` (call before committing).
+
+    Updates the rollups, and the stock when the order is cancelled or a
+    cancelled order is reopened, in the same transaction. Reopening takes
+    the items out of stock with the same conditional decrements as
+    checkout, so it raises OrderError (and rolls back) if they have been
+    sold meanwhile. Returns True when stock changed; the caller should then
+    `invalidate_catalog()` after committing.
+    """
+    if new_status == order.status:
+        return False
+    stock_changed = (new_status == 'cancelled') != (order.status == 'cancelled')
+    if stock_changed:
+        quantities, variant_quantities = _order_quantities(order.id)
+        if new_status == 'cancelled':
+            _increment_stock(ProductVariant, variant_quantities)
+            _increment_stock(Product, quantities)
+        elif not (_decrement_stock(ProductVariant, variant_quantities)
+                  and _decrement_stock(Product, quantities)):
+            db.session.rollback()
+            raise OrderError('Not enough stock to reopen this order', status=409,
+                             details=_stock_shortages(ProductVariant, variant_quantities)
+                             + _stock_shortages(Product, quantities))
+    rollups.record_status_change(order, order.status, new_status)
+    order.status = new_status
+    return stock_changed
@@ -0,0 +1,83 @@
+"""
+Full-page response cache for storefront views.
+
+Rendered pages are keyed on the request URL (path and query string) and the
+current catalog version, so any admin change to products or categories makes
+every cached page stale at once. Responses carry an ETag and Last-Modified
+header and conditional GETs are answered with 304 Not Modified.
+"""
+import hashlib
+import threading
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, request
+from flask_login import current_user
+
+from services.cache import TTLCache
+from services.catalog import catalog_state
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLCache(
+                    maxsize=current_app.config.get('PAGE_CACHE_SIZE', 256),
+                    ttl=current_app.config.get('PAGE_CACHE_TTL', 600)
+                )
+    return _cache
+
+
+def _cache_key():
+    key = (request.full_path, catalog_state().version)
+    if current_user.is_authenticated:
+        # Pages greet the signed-in user, so they can never be shared
+        key += (current_user.get_id(),)
+    return key
+
+
+def cache_page(view):
+    """Cache a GET view's rendered output until the catalog changes.
+
+    Signed-in users bypass the cache unless PAGE_CACHE_SKIP_AUTHENTICATED
+    is turned off, in which case they get their own entries.
+    """
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        config = current_app.config
+        if (request.method != 'GET'
+                or not config.get('PAGE_CACHE_ENABLED', True)
+                or (current_user.is_authenticated
+                    and config.get('PAGE_CACHE_SKIP_AUTHENTICATED', True))):
+            return view(*args, **kwargs)
+
+        key = _cache_key()
+        cache = _get_cache()
+        entry = cache.get(key)
+        if entry is None:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            body = response.get_data()
+            entry = {
+                'body': body,
+                'mimetype': response.mimetype,
+                'etag': hashlib.sha1(body).hexdigest(),
+                'last_modified': datetime.fromtimestamp(catalog_state().updated_at, timezone.utc)
+            }
+            cache.set(key, entry)
+
+        response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['last_modified']
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+
+    return decorated_function
+
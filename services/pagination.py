@@ -0,0 +1,162 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page remembers the sort key of its first and last
+row in an opaque cursor and the next query seeks past it, so every page
+costs the same as the first. Totals are only counted when asked for.
+"""
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """One page of keyset-paginated results"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _signature(order_by):
+    text = '|'.join(f"{expression}:{'desc' if descending else 'asc'}"
+                    for expression, descending in order_by)
+    return hashlib.sha1(text.encode()).hexdigest()[:8]
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values, direction, signature):
+    payload = {'k': [_encode_value(value) for value in values], 'd': direction, 's': signature}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, signature):
+    """Return `(values, direction)`, or None for a malformed or foreign cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload['s'] != signature or payload['d'] not in ('next', 'prev'):
+            return None
+        return [_decode_value(value) for value in payload['k']], payload['d']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _seek_condition(order_by, values):
+    # (a, b, c) > (x, y, z) expanded so each column can have its own direction
+    clauses = []
+    for index, (expression, descending) in enumerate(order_by):
+        equal = [order_by[i][0] == values[i] for i in range(index)]
+        beyond = expression < values[index] if descending else expression > values[index]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def order_clauses(order_by):
+    """Turn `(expression, descending)` pairs into ORDER BY clauses"""
+    return [expression.desc() if descending else expression.asc()
+            for expression, descending in order_by]
+
+
+def keyset_paginate(query, order_by, cursor=None, per_page=20, with_total=False):
+    """Paginate `query` by the sort keys in `order_by`.
+
+    `order_by` is a list of `(expression, descending)` pairs; the last one
+    must be unique (normally the primary key) so every row has a distinct
+    position. Pass `with_total=True` to run a COUNT for an exact total.
+    """
+    signature = _signature(order_by)
+    total = query.order_by(None).count() if with_total else None
+
+    decoded = decode_cursor(cursor, signature) if cursor else None
+    direction = decoded[1] if decoded else 'next'
+
+    # Walking backwards flips every sort direction, then the page is reversed
+    effective = [(expression, descending != (direction == 'prev'))
+                 for expression, descending in order_by]
+    if decoded and len(decoded[0]) == len(order_by):
+        query = query.filter(_seek_condition(effective, decoded[0]))
+    else:
+        decoded = None
+
+    query = query.order_by(None).order_by(*order_clauses(effective))
+    query = query.add_columns(*[
+        expression.label(f'_keyset_{index}')
+        for index, (expression, _) in enumerate(order_by)
+    ])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    if not rows:
+        return KeysetPage(items, per_page, total=total)
+
+    first_key = list(rows[0][1:])
+    last_key = list(rows[-1][1:])
+    if direction == 'next':
+        has_next, has_prev = has_more, decoded is not None
+    else:
+        has_next, has_prev = True, has_more
+
+    return KeysetPage(
+        items,
+        per_page,
+        next_cursor=encode_cursor(last_key, 'next', signature) if has_next else None,
+        prev_cursor=encode_cursor(first_key, 'prev', signature) if has_prev else None,
+        total=total
+    )
+
+
+def paginate_request(query, order_by, per_page=20):
+    """Paginate `query` according to the current request's arguments.
+
+    Links carrying `?page=N` keep the classic OFFSET pagination with an exact
+    total; everything else is keyset-paginated from `?cursor=`. Keyset pages
+    only count the total when PAGINATION_EXACT_TOTALS is set or the request
+    asks for `?count=exact`.
+    """
+    if 'page' in request.args:
+        return query.order_by(None).order_by(*order_clauses(order_by)).paginate(
+            page=request.args.get('page', 1, type=int),
+            per_page=per_page,
+            error_out=False
+        )
+
+    with_total = (current_app.config.get('PAGINATION_EXACT_TOTALS', False)
+                  or request.args.get('count') == 'exact')
+    return keyset_paginate(query, order_by, cursor=request.args.get('cursor'),
+                           per_page=per_page, with_total=with_total)
@@ -0,0 +1,293 @@
+"""
+Bulk product import and export.
+
+Imports stream an uploaded CSV or JSONL file row by row. Valid rows are
+collected into batches that are upserted with executemany statements, one
+transaction per batch; invalid rows are skipped and reported with their
+line number. A row updates an existing product when its `id` (or, without
+an id, its exact `name`) matches one, otherwise it is inserted. Rows that
+list sizes/colors get fresh variants with the row's stock spread over them.
+
+Exports walk the product table in primary-key chunks and yield one line at
+a time, so memory use does not grow with the catalog.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import delete, insert, select, update
+
+from models import db, Category, Product, ProductVariant
+from services.variants import combinations, distribute_stock
+
+FIELDS = ['id', 'name', 'description', 'price', 'stock', 'category', 'image_url', 'sizes', 'colors']
+BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+MAX_ERRORS = 1000
+DEFAULT_IMAGE_URL = '/static/images/products/default.jpg'
+
+
+class ImportResult:
+    """Counters and per-row errors of one import"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []
+        self.error_count = 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    @property
+    def processed(self):
+        return self.inserted + self.updated
+
+
+def _read_rows(stream, file_format):
+    """Yield (line number, dict) pairs from a binary upload stream"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            yield line_number, row if isinstance(row, dict) else ValueError('Each line must be a JSON object')
+
+
+def _options(value):
+    """Sizes/colors as a list: JSON list, or a '|'-separated CSV cell"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value).split('|') if item.strip()]
+
+
+def _clean_row(row, categories):
+    """Validate one input row; returns a dict of column values or raises ValueError"""
+    row = {key.strip().lower(): value for key, value in row.items() if key}
+    clean = {}
+
+    if row.get('id') not in (None, ''):
+        try:
+            clean['id'] = int(row['id'])
+        except (TypeError, ValueError):
+            raise ValueError('id must be an integer')
+
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError('name is required')
+    if len(name) > Product.name.type.length:
+        raise ValueError(f'name is longer than {Product.name.type.length} characters')
+    clean['name'] = name
+
+    try:
+        clean['price'] = round(float(row.get('price')), 2)
+    except (TypeError, ValueError):
+        raise ValueError('price must be a number')
+    if clean['price'] < 0:
+        raise ValueError('price cannot be negative')
+
+    if row.get('stock') not in (None, ''):
+        try:
+            clean['stock'] = int(row['stock'])
+        except (TypeError, ValueError):
+            raise ValueError('stock must be an integer')
+        if clean['stock'] < 0:
+            raise ValueError('stock cannot be negative')
+
+    category = row.get('category', row.get('category_id'))
+    if category in (None, ''):
+        raise ValueError('category is required')
+    category_id = categories.get(str(category).strip().lower())
+    if category_id is None:
+        raise ValueError(f'unknown category "{category}"')
+    clean['category_id'] = category_id
+
+    if row.get('description') is not None:
+        clean['description'] = str(row['description'])
+    if row.get('image_url'):
+        clean['image_url'] = str(row['image_url'])
+
+    sizes, colors = _options(row.get('sizes')), _options(row.get('colors'))
+    if sizes is not None or colors is not None:
+        clean['sizes'] = json.dumps(sizes or [])
+        clean['colors'] = json.dumps(colors or [])
+    return clean
+
+
+def _category_lookup():
+    """Category ids by lower-cased name and by id"""
+    lookup = {}
+    for category_id, name in db.session.execute(select(Category.id, Category.name)):
+        lookup[name.lower()] = category_id
+        lookup[str(category_id)] = category_id
+    return lookup
+
+
+def _write_batch(batch, result):
+    """Upsert one batch of (line, row) pairs in a single transaction"""
+    ids = {row['id'] for _, row in batch if 'id' in row}
+    names = {row['name'] for _, row in batch if 'id' not in row}
+    existing_ids = set(db.session.scalars(select(Product.id).where(Product.id.in_(ids)))) if ids else set()
+    ids_by_name = dict(db.session.execute(
+        select(Product.name, Product.id).where(Product.name.in_(names)).order_by(Product.id.desc())
+    ).all()) if names else {}
+
+    updates, inserts, variant_rows = [], [], []
+    for line, row in batch:
+        product_id = row.get('id')
+        if product_id is None:
+            product_id = ids_by_name.get(row['name'])
+        elif product_id not in existing_ids:
+            result.add_error(line, f"no product with id {product_id}")
+            continue
+        if product_id is not None:
+            updates.append(dict(row, id=product_id))
+        else:
+            inserts.append(dict({'description': '', 'stock': 0, 'image_url': DEFAULT_IMAGE_URL,
+                                 'sizes': '[]', 'colors': '[]'}, **row))
+
+    # Updates must share one set of columns per executemany; group them by their keys
+    by_columns = {}
+    for row in updates:
+        by_columns.setdefault(tuple(sorted(row)), []).append(row)
+    for rows in by_columns.values():
+        db.session.execute(update(Product), rows)
+
+    new_ids = []
+    if inserts:
+        new_ids = list(db.session.scalars(
+            insert(Product).returning(Product.id, sort_by_parameter_order=True), inserts
+        ))
+
+    # Inserted rows and rows listing options get a fresh set of variants holding
+    # the row's stock; a stock-only update is spread over the existing options
+    rebalance_ids = [row['id'] for row in updates if 'sizes' not in row and 'stock' in row]
+    existing_options = {}
+    if rebalance_ids:
+        for product_id, size, color in db.session.execute(
+            select(ProductVariant.product_id, ProductVariant.size, ProductVariant.color)
+            .where(ProductVariant.product_id.in_(rebalance_ids)).order_by(ProductVariant.id)
+        ):
+            existing_options.setdefault(product_id, []).append((size, color))
+    for product_id, row in [(row['id'], row) for row in updates] + list(zip(new_ids, inserts)):
+        if 'sizes' in row:
+            combos = combinations(json.loads(row['sizes']), json.loads(row['colors']))
+        elif product_id in existing_options:
+            combos = existing_options[product_id]
+        else:
+            continue
+        variant_rows.append((product_id, combos, row.get('stock')))
+    if variant_rows:
+        _replace_variants(variant_rows)
+
+    db.session.commit()
+    result.updated += len(updates)
+    result.inserted += len(inserts)
+
+
+def _replace_variants(variant_rows):
+    product_ids = [product_id for product_id, _, _ in variant_rows]
+    current_stock = dict(db.session.execute(
+        select(Product.id, Product.stock).where(Product.id.in_(product_ids))
+    ).all())
+    db.session.execute(delete(ProductVariant).where(ProductVariant.product_id.in_(product_ids)))
+    rows = []
+    for product_id, combos, stock in variant_rows:
+        stock = current_stock.get(product_id, 0) if stock is None else stock
+        for (size, color), variant_stock in zip(combos, distribute_stock(stock, len(combos))):
+            rows.append({'product_id': product_id, 'size': size, 'color': color, 'stock': variant_stock})
+    db.session.execute(insert(ProductVariant), rows)
+
+
+def import_products(stream, file_format, batch_size=BATCH_SIZE):
+    """Import products from a CSV or JSONL byte stream; returns an ImportResult"""
+    result = ImportResult()
+    categories = _category_lookup()
+    batch = []
+    seen = {}
+    for line, row in _read_rows(stream, file_format):
+        if isinstance(row, Exception):
+            result.add_error(line, str(row))
+            continue
+        try:
+            clean = _clean_row(row, categories)
+        except ValueError as e:
+            result.add_error(line, str(e))
+            continue
+
+        # The same product twice in one batch would make the executemany ambiguous
+        key = ('id', clean['id']) if 'id' in clean else ('name', clean['name'])
+        if key in seen:
+            _write_batch(batch, result)
+            batch, seen = [], {}
+        seen[key] = line
+        batch.append((line, clean))
+        if len(batch) >= batch_size:
+            _write_batch(batch, result)
+            batch, seen = [], {}
+    if batch:
+        _write_batch(batch, result)
+    return result
+
+
+def _export_chunks(chunk_size):
+    """Yield lists of product rows with their category name and variant options"""
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Product.id, Product.name, Product.description, Product.price, Product.stock,
+                   Category.name.label('category'), Product.image_url)
+            .outerjoin(Category, Category.id == Product.category_id)
+            .where(Product.id > last_id)
+            .order_by(Product.id)
+            .limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            return
+        options = {}
+        for product_id, size, color in db.session.execute(
+            select(ProductVariant.product_id, ProductVariant.size, ProductVariant.color)
+            .where(ProductVariant.product_id.in_([row['id'] for row in rows]))
+            .order_by(ProductVariant.id)
+        ):
+            sizes, colors = options.setdefault(product_id, ([], []))
+            if size and size not in sizes:
+                sizes.append(size)
+            if color and color not in colors:
+                colors.append(color)
+        last_id = rows[-1]['id']
+        # End the read transaction so a long export never pins a connection
+        db.session.rollback()
+        yield [dict(row, sizes=options.get(row['id'], ([], []))[0], colors=options.get(row['id'], ([], []))[1])
+               for row in rows]
+
+
+def export_products(file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generator of CSV or JSONL text for the whole catalog"""
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+        writer.writeheader()
+        for chunk in _export_chunks(chunk_size):
+            for row in chunk:
+                writer.writerow(dict(row, sizes='|'.join(row['sizes']), colors='|'.join(row['colors'])))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for chunk in _export_chunks(chunk_size):
+            yield ''.join(json.dumps(row) + '\n' for row in chunk)
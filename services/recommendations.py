@@ -0,0 +1,110 @@
+"""
+"Frequently bought together" recommendations.
+
+`product_pair` counts, for every two products, how many orders contained
+both; `product_neighbors` keeps each product's top-K partners as a small
+JSON list, so the product page reads its recommendations with one
+primary-key lookup. `rebuild_recommendations()` recomputes both tables from
+the order history in SQL; `record_order()` folds a new order's pairs in and
+refreshes the neighbors of its products, as a background job queued by
+checkout so the upserts never hold the write lock of an order transaction.
+"""
+import json
+from datetime import datetime
+from itertools import permutations
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, OrderItem, ProductNeighbors, ProductPair
+from services import jobs
+from services.catalog import get_products, get_related_products
+
+TOP_K = 10
+
+
+def _top_k():
+    return current_app.config.get('RECOMMENDATIONS_TOP_K', TOP_K)
+
+
+def _ranked_pairs(product_ids=None):
+    """(product_id, other_id) of each product's strongest pairs, best first"""
+    rank = func.row_number().over(
+        partition_by=ProductPair.product_id,
+        order_by=(ProductPair.order_count.desc(), ProductPair.other_id)
+    ).label('rank')
+    ranked = select(ProductPair.product_id, ProductPair.other_id, rank)
+    if product_ids is not None:
+        ranked = ranked.where(ProductPair.product_id.in_(product_ids))
+    ranked = ranked.subquery()
+    return select(ranked.c.product_id, ranked.c.other_id) \
+        .where(ranked.c.rank <= _top_k()) \
+        .order_by(ranked.c.product_id, ranked.c.rank)
+
+
+def _write_neighbors(product_ids=None):
+    """Recompute the neighbor lists of `product_ids` (every product when None)"""
+    neighbors = {product_id: [] for product_id in product_ids or ()}
+    for product_id, other_id in db.session.execute(_ranked_pairs(product_ids)):
+        neighbors.setdefault(product_id, []).append(other_id)
+    if not neighbors:
+        return
+    stmt = insert(ProductNeighbors)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['product_id'],
+        set_={'neighbor_ids': stmt.excluded.neighbor_ids, 'updated_at': stmt.excluded.updated_at}
+    )
+    now = datetime.utcnow()
+    db.session.execute(stmt, [
+        {'product_id': product_id, 'neighbor_ids': json.dumps(ids), 'updated_at': now}
+        for product_id, ids in neighbors.items()
+    ])
+
+
+@jobs.handler('recommendations.record_order')
+def record_order(product_ids):
+    """Count a new order's product pairs and refresh their neighbors (caller commits)"""
+    product_ids = sorted(set(product_ids))
+    if len(product_ids) < 2:
+        return
+    stmt = insert(ProductPair)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['product_id', 'other_id'],
+        set_={'order_count': ProductPair.order_count + 1}
+    )
+    db.session.execute(stmt, [
+        {'product_id': product_id, 'other_id': other_id, 'order_count': 1}
+        for product_id, other_id in permutations(product_ids, 2)
+    ])
+    _write_neighbors(product_ids)
+
+
+def rebuild_recommendations():
+    """Recompute the pair counts and every neighbor list from the order history"""
+    first = select(OrderItem.order_id, OrderItem.product_id).distinct().subquery()
+    second = select(OrderItem.order_id, OrderItem.product_id).distinct().subquery()
+    db.session.query(ProductNeighbors).delete()
+    db.session.query(ProductPair).delete()
+    db.session.execute(ProductPair.__table__.insert().from_select(
+        ['product_id', 'other_id', 'order_count'],
+        select(first.c.product_id, second.c.product_id, func.count())
+        .select_from(first)
+        .join(second, (second.c.order_id == first.c.order_id) & (second.c.product_id != first.c.product_id))
+        .group_by(first.c.product_id, second.c.product_id)
+    ))
+    _write_neighbors()
+    count = db.session.query(ProductNeighbors).count()
+    db.session.commit()
+    return count
+
+
+def get_recommended_products(product, limit=4):
+    """Products most often bought with `product`, topped up with others from its category"""
+    neighbors = db.session.get(ProductNeighbors, product.id)
+    ids = json.loads(neighbors.neighbor_ids)[:limit] if neighbors else []
+    recommended = get_products(ids) if ids else []
+    if len(recommended) < limit:
+        chosen = {item.id for item in recommended}
+        recommended += [item for item in get_related_products(product, limit) if item.id not in chosen]
+    return recommended[:limit]
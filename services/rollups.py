@@ -0,0 +1,102 @@
+"""
+Revenue rollup tables for the admin analytics page.
+
+`daily_revenue` and `monthly_revenue` hold revenue, order count and items
+sold per period and order status. They are updated in the same transaction
+that creates an order or changes its status, so analytics reads a handful of
+rollup rows instead of aggregating the whole order table.
+"""
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Order, OrderItem, DailyRevenue, MonthlyRevenue
+
+
+def _apply(created_at, status, revenue, orders, items):
+    status = status or 'pending'
+    for model, key in ((DailyRevenue, {'day': created_at.date()}),
+                       (MonthlyRevenue, {'month': created_at.strftime('%Y-%m')})):
+        stmt = insert(model).values(
+            status=status, revenue=revenue, order_count=orders, items_sold=items, **key
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[*key, 'status'],
+            set_={
+                'revenue': model.revenue + stmt.excluded.revenue,
+                'order_count': model.order_count + stmt.excluded.order_count,
+                'items_sold': model.items_sold + stmt.excluded.items_sold
+            }
+        )
+        db.session.execute(stmt)
+
+
+def _items_sold(order_id):
+    return db.session.execute(
+        select(func.coalesce(func.sum(OrderItem.quantity), 0)).where(OrderItem.order_id == order_id)
+    ).scalar()
+
+
+def record_order(order, items_sold=None):
+    """Add a newly created order to the rollups (call before committing)"""
+    if items_sold is None:
+        items_sold = _items_sold(order.id)
+    _apply(order.created_at, order.status, order.total_amount, 1, items_sold)
+
+
+def record_status_change(order, old_status, new_status):
+    """Move an order's totals from its old status bucket to the new one"""
+    if old_status == new_status:
+        return
+    items_sold = _items_sold(order.id)
+    _apply(order.created_at, old_status, -order.total_amount, -1, -items_sold)
+    _apply(order.created_at, new_status, order.total_amount, 1, items_sold)
+
+
+def _rollup_select(period):
+    items = select(
+        OrderItem.order_id, func.sum(OrderItem.quantity).label('quantity')
+    ).group_by(OrderItem.order_id).subquery()
+    status = func.coalesce(Order.status, 'pending')
+    return select(
+        period,
+        status,
+        func.sum(Order.total_amount),
+        func.count(Order.id),
+        func.coalesce(func.sum(items.c.quantity), 0)
+    ).select_from(Order).outerjoin(items, items.c.order_id == Order.id).group_by(period, status)
+
+
+def rebuild_rollups():
+    """Recompute both rollup tables from the order history"""
+    columns = ['status', 'revenue', 'order_count', 'items_sold']
+    db.session.query(DailyRevenue).delete()
+    db.session.query(MonthlyRevenue).delete()
+    db.session.execute(DailyRevenue.__table__.insert().from_select(
+        ['day', *columns], _rollup_select(func.date(Order.created_at))
+    ))
+    db.session.execute(MonthlyRevenue.__table__.insert().from_select(
+        ['month', *columns], _rollup_select(func.strftime('%Y-%m', Order.created_at))
+    ))
+    db.session.commit()
+
+
+def revenue_summary():
+    """Totals across every status plus per-month revenue, from the rollups"""
+    total_revenue, total_orders, items_sold = db.session.execute(
+        select(
+            func.coalesce(func.sum(MonthlyRevenue.revenue), 0),
+            func.coalesce(func.sum(MonthlyRevenue.order_count), 0),
+            func.coalesce(func.sum(MonthlyRevenue.items_sold), 0)
+        )
+    ).one()
+    monthly_revenue = db.session.execute(
+        select(MonthlyRevenue.month, func.sum(MonthlyRevenue.revenue))
+        .group_by(MonthlyRevenue.month)
+        .order_by(MonthlyRevenue.month)
+    ).all()
+    return {
+        'total_revenue': total_revenue,
+        'total_orders': total_orders,
+        'items_sold': items_sold,
+        'monthly_revenue': monthly_revenue
+    }
@@ -0,0 +1,160 @@
+"""
+Full-text product search backed by an SQLite FTS5 index.
+
+The `product_search` virtual table mirrors the searchable product text
+(name, description and category name) keyed on the product id. Triggers on
+the `product` and `category` tables keep it in sync, so every write path
+(admin add/edit/delete, category CRUD, scripts) updates the index in the same
+transaction without any extra Python calls.
+"""
+import re
+
+from sqlalchemy import column, literal_column, or_, table, text
+
+from models import db, Product, Category
+
+SEARCH_TABLE = 'product_search'
+
+# Column weights for bm25 ranking: name, description, category name
+RANK_FUNCTION = 'bm25(10.0, 1.0, 4.0)'
+
+search_table = table(SEARCH_TABLE, column('rowid'), column('rank'))
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        name, description, category_name,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON product BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, name, description, category_name)
+        SELECT new.id, new.name, new.description,
+               (SELECT name FROM category WHERE id = new.category_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_search_au
+        AFTER UPDATE OF id, name, description, category_id ON product BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        INSERT INTO {SEARCH_TABLE}(rowid, name, description, category_name)
+        SELECT new.id, new.name, new.description,
+               (SELECT name FROM category WHERE id = new.category_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON product BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_search_cu AFTER UPDATE OF name ON category BEGIN
+        UPDATE {SEARCH_TABLE} SET category_name = new.name
+        WHERE rowid IN (SELECT id FROM product WHERE category_id = new.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS product_search_cd AFTER DELETE ON category BEGIN
+        UPDATE {SEARCH_TABLE} SET category_name = NULL
+        WHERE rowid IN (SELECT id FROM product WHERE category_id = old.id);
+    END""",
+]
+
+_TRIGGERS = ['product_search_ai', 'product_search_au', 'product_search_ad',
+             'product_search_cu', 'product_search_cd']
+
+
+def search_available():
+    """Full-text search needs SQLite; other databases use the ILIKE fallback"""
+    return db.engine.dialect.name == 'sqlite'
+
+
+def ensure_search_index():
+    """Create the FTS5 table and sync triggers, building the index if new"""
+    if not search_available():
+        return
+
+    with db.engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_TABLE}
+        ).first()
+        for statement in _SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(
+            text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', :rank)"),
+            {'rank': RANK_FUNCTION}
+        )
+
+    if not exists:
+        rebuild_search_index()
+
+
+def drop_search_index():
+    """Drop the FTS5 table and its triggers, which `db.drop_all()` does not know about"""
+    if not search_available():
+        return
+
+    with db.engine.begin() as conn:
+        for trigger in _TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+def rebuild_search_index():
+    """Repopulate the index from the product and category tables"""
+    if not search_available():
+        return 0
+
+    with db.engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+        result = conn.execute(text(f"""
+            INSERT INTO {SEARCH_TABLE}(rowid, name, description, category_name)
+            SELECT product.id, product.name, product.description, category.name
+            FROM product LEFT JOIN category ON category.id = product.category_id
+        """))
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+    return result.rowcount
+
+
+def build_match_expression(search):
+    """Turn free-form user input into an FTS5 prefix query.
+
+    Every word becomes a quoted prefix term, so "slim je" matches
+    "Slim Fit Jeans" and FTS5 operators typed by the user are ignored.
+    """
+    terms = _TOKEN_RE.findall(search or '')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def relevance_order(search):
+    """Sort keys for ranked search results, best match first.
+
+    Only a search with terms joins the index (see filter_products), so one
+    without any falls back to newest first instead of sorting by a rank column
+    that is not in the query.
+    """
+    if not search_available() or not build_match_expression(search):
+        return [(Product.id, True)]
+    return [(search_table.c.rank, False), (Product.id, True)]
+
+
+def filter_products(query, search, ranked=True):
+    """Restrict a Product query to rows matching the search text.
+
+    When `ranked` is true the results are ordered by relevance; callers that
+    apply their own sort should pass ranked=False.
+    """
+    if not search_available():
+        search_term = f"%{search}%"
+        return query.join(Category).filter(
+            or_(
+                Product.name.ilike(search_term),
+                Product.description.ilike(search_term),
+                Category.name.ilike(search_term)
+            )
+        )
+
+    match = build_match_expression(search)
+    if not match:
+        return query.filter(db.false())
+
+    query = query.join(search_table, search_table.c.rowid == Product.id).filter(
+        literal_column(SEARCH_TABLE).op('MATCH')(match)
+    )
+    if ranked:
+        query = query.order_by(search_table.c.rank, Product.id.desc())
+    return query
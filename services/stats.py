@@ -0,0 +1,83 @@
+"""
+Admin dashboard counters.
+
+All counters are computed in a single SELECT of scalar subqueries (order
+count and revenue come from the revenue rollups rather than the order
+table) and kept in a short-TTL cache. New orders are folded into the cached
+counters directly; other writes simply invalidate them.
+"""
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+from models import db, Product, Order, User, MonthlyRevenue
+from services.cache import TTLCache
+
+RECENT_ORDERS = 5
+
+_cache = TTLCache(maxsize=1)
+_lock = threading.Lock()
+
+
+def _order_summary(order):
+    return {
+        'id': order.id,
+        'order_number': order.order_number,
+        'customer': f"{order.user.first_name} {order.user.last_name}" if order.user else None,
+        'total_amount': order.total_amount,
+        'status': order.status,
+        'created_at': order.created_at.isoformat() if order.created_at else None
+    }
+
+
+def compute_stats():
+    """Run the dashboard queries: one round trip for counters, one for recent orders"""
+    total_products, total_orders, total_users, total_revenue = db.session.execute(
+        select(
+            select(func.count(Product.id)).scalar_subquery(),
+            select(func.coalesce(func.sum(MonthlyRevenue.order_count), 0)).scalar_subquery(),
+            select(func.count(User.id)).scalar_subquery(),
+            select(func.coalesce(func.sum(MonthlyRevenue.revenue), 0)).scalar_subquery()
+        )
+    ).one()
+    recent_orders = Order.query.options(joinedload(Order.user)).order_by(
+        Order.created_at.desc(), Order.id.desc()
+    ).limit(RECENT_ORDERS).all()
+
+    return {
+        'total_products': total_products,
+        'total_orders': total_orders,
+        'total_users': total_users,
+        'total_revenue': total_revenue,
+        'recent_orders': [_order_summary(order) for order in recent_orders],
+        'generated_at': datetime.utcnow().isoformat()
+    }
+
+
+def get_stats():
+    """Dashboard counters, served from cache for STATS_CACHE_TTL seconds"""
+    with _lock:
+        stats = _cache.get('stats')
+        if stats is None:
+            stats = compute_stats()
+            _cache.set('stats', stats, ttl=current_app.config.get('STATS_CACHE_TTL', 30))
+        return dict(stats)
+
+
+def record_order_created(order):
+    """Fold a freshly committed order into the cached counters"""
+    with _lock:
+        stats = _cache.get('stats')
+        if stats is None:
+            return
+        stats['total_orders'] += 1
+        stats['total_revenue'] += order.total_amount
+        stats['recent_orders'] = [_order_summary(order)] + stats['recent_orders'][:RECENT_ORDERS - 1]
+
+
+def invalidate_stats():
+    """Forget the cached counters after a product, user or order change"""
+    _cache.clear()
@@ -0,0 +1,98 @@
+"""
+Product variants (size/color combinations with their own stock).
+
+`Product.sizes`/`Product.colors` are kept as the list of options shown on
+the admin form, but `product_variant` rows are what the shop filters on and
+what order stock checks resolve to. `Product.stock` stays the total across
+a product's variants.
+"""
+import json
+
+from sqlalchemy import select
+
+from models import db, Product, ProductVariant
+
+
+def parse_options(raw):
+    """Decode a JSON list column, tolerating empty or malformed values"""
+    if not raw:
+        return []
+    try:
+        values = json.loads(raw)
+    except ValueError:
+        return []
+    return [str(value) for value in values if value] if isinstance(values, list) else []
+
+
+def combinations(sizes, colors):
+    """Every (size, color) pair; a missing dimension is represented by None"""
+    return [(size, color) for size in (sizes or [None]) for color in (colors or [None])]
+
+
+def distribute_stock(total, count):
+    """Split `total` units as evenly as possible over `count` variants"""
+    base, remainder = divmod(max(total or 0, 0), count)
+    return [base + (1 if index < remainder else 0) for index in range(count)]
+
+
+def sync_variants(product, sizes, colors, rebalance=False):
+    """Make `product.variants` match the offered sizes and colors.
+
+    Dropped combinations are removed and new ones added. With `rebalance`
+    (or when new combinations appear) `product.stock` is spread evenly over
+    the variants; otherwise `product.stock` is recomputed from them.
+    """
+    wanted = combinations(sizes, colors)
+    existing = {(variant.size, variant.color): variant for variant in product.variants}
+
+    for key, variant in existing.items():
+        if key not in wanted:
+            product.variants.remove(variant)
+
+    added = False
+    for size, color in wanted:
+        if (size, color) not in existing:
+            product.variants.append(ProductVariant(size=size, color=color, stock=0))
+            added = True
+
+    if rebalance or added:
+        for variant, stock in zip(product.variants, distribute_stock(product.stock, len(product.variants))):
+            variant.stock = stock
+    else:
+        product.stock = sum(variant.stock for variant in product.variants)
+
+
+def variant_options(product):
+    """Sizes and colors a product is offered in, in their original order"""
+    sizes, colors = [], []
+    for variant in sorted(product.variants, key=lambda variant: variant.id or 0):
+        if variant.size and variant.size not in sizes:
+            sizes.append(variant.size)
+        if variant.color and variant.color not in colors:
+            colors.append(variant.color)
+    return sizes, colors
+
+
+def filter_by_variant(query, sizes=None, colors=None):
+    """Restrict a Product query to products with an in-stock matching variant"""
+    if not sizes and not colors:
+        return query
+    conditions = [ProductVariant.stock > 0]
+    if sizes:
+        conditions.append(ProductVariant.size.in_(sizes))
+    if colors:
+        conditions.append(ProductVariant.color.in_(colors))
+    return query.filter(Product.id.in_(select(ProductVariant.product_id).where(*conditions)))
+
+
+def migrate_json_variants(batch_size=500):
+    """Create variants from the legacy JSON columns for products that have none"""
+    migrated = 0
+    while True:
+        products = Product.query.filter(~Product.variants.any()).order_by(Product.id).limit(batch_size).all()
+        if not products:
+            return migrated
+        for product in products:
+            sync_variants(product, parse_options(product.sizes), parse_options(product.colors), rebalance=True)
+        db.session.commit()
+        migrated += len(products)
@@ -0,0 +1,40 @@
+"""
+Warm-up before a server starts taking traffic.
+
+`warm_up()` compiles every template (through the Jinja bytecode cache when
+one is configured, so the next boot only has to load it) and renders the
+`WARM_UP_URLS` pages once, which fills the catalog, facet and page caches
+and SQLAlchemy's statement cache. wsgi.py runs it in the gunicorn master
+before the workers are forked, so each worker starts warm.
+"""
+import time
+
+
+def compile_templates(app):
+    """Load every HTML template into the Jinja environment; returns how many"""
+    names = app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def prime_pages(app):
+    """Render the warm-up pages without counting them in the request metrics"""
+    metrics_enabled = app.config.get('METRICS_ENABLED', True)
+    app.config['METRICS_ENABLED'] = False
+    try:
+        client = app.test_client()
+        for url in app.config.get('WARM_UP_URLS', []):
+            response = client.get(url)
+            if response.status_code != 200:
+                app.logger.warning('Warm-up request %s returned HTTP %s', url, response.status_code)
+    finally:
+        app.config['METRICS_ENABLED'] = metrics_enabled
+
+
+def warm_up(app):
+    started = time.perf_counter()
+    templates = compile_templates(app)
+    prime_pages(app)
+    app.logger.info('Warm-up: %d templates compiled, %d pages primed in %.2fs', templates,
+                    len(app.config.get('WARM_UP_URLS', [])), time.perf_counter() - started)
@@ -1,6 +1,7 @@
 @echo off
 echo Starting ZEECLOTHS E-commerce Application...
 echo.
+rem Sample catalog and users on the first run only
+if not exist instance\zeecloths.db python -m flask --app app seed
 python app.py
 pause
-
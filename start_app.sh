@@ -1,5 +1,11 @@
 #!/bin/bash
 echo "Starting ZEECLOTHS E-commerce Application..."
 echo
+# Sample catalog and users on the first run only
+if [ ! -f instance/zeecloths.db ]; then
+    python3 -m flask --app app seed
+fi
+if [ "$1" = "--production" ]; then
+    exec gunicorn -c gunicorn.conf.py wsgi:app
+fi
 python3 app.py
-
@@ -3,12 +3,90 @@ class CartManager {
   constructor() {
     this.cart = JSON.parse(localStorage.getItem('cart')) || [];
     this.isOpen = false;
+    this.syncTimer = null;
     this.init();
   }
 
   init() {
     this.renderCart();
     this.bindEvents();
+    this.loadServerCart();
+  }
+
+  // Load the server-side cart (merged into the account at login), or upload the local one
+  async loadServerCart() {
+    try {
+      const response = await fetch('/api/v1/cart', { credentials: 'same-origin' });
+      if (!response.ok) return;
+      const data = await response.json();
+      if (data.cart.items.length > 0) {
+        this.applyServerCart(data.cart);
+      } else if (this.cart.length > 0) {
+        this.syncCart();
+      }
+    } catch (error) {
+      console.log('Cart sync unavailable:', error);
+    }
+  }
+
+  // Replace the local cart with validated server lines (current prices and stock)
+  applyServerCart(serverCart) {
+    this.cart = serverCart.items.map(line => ({
+      id: line.product_id,
+      name: line.name || 'Unavailable product',
+      price: line.price || 0,
+      image: line.image_url,
+      size: line.size,
+      color: line.color,
+      quantity: line.quantity,
+      stock: line.stock,
+      status: line.status
+    }));
+    localStorage.setItem('cart', JSON.stringify(this.cart));
+    this.renderCart();
+  }
+
+  cartPayload() {
+    return {
+      items: this.cart.map(item => ({
+        product_id: item.id,
+        quantity: item.quantity,
+        size: item.size || null,
+        color: item.color || null,
+        price: item.price
+      }))
+    };
+  }
+
+  // Store the cart on the server a moment after the last change
+  syncCart() {
+    clearTimeout(this.syncTimer);
+    this.syncTimer = setTimeout(async () => {
+      try {
+        const response = await fetch('/api/v1/cart', {
+          method: 'PUT',
+          credentials: 'same-origin',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify(this.cartPayload())
+        });
+        if (response.ok) {
+          this.applyServerCart((await response.json()).cart);
+        }
+      } catch (error) {
+        console.log('Cart sync unavailable:', error);
+      }
+    }, 300);
+  }
+
+  // Why a line cannot be bought as it is
+  lineWarning(item) {
+    switch (item.status) {
+      case 'unavailable': return 'Choose an available size and color';
+      case 'out_of_stock': return 'Out of stock';
+      case 'insufficient_stock': return `Only ${item.stock} left`;
+      case 'not_found': return 'No longer available';
+      default: return '';
+    }
   }
 
   // Add product to cart
@@ -72,9 +150,10 @@ class CartManager {
     return this.cart.reduce((count, item) => count + item.quantity, 0);
   }
 
-  // Save cart to localStorage
+  // Save cart to localStorage and the server
   saveCart() {
     localStorage.setItem('cart', JSON.stringify(this.cart));
+    this.syncCart();
   }
 
   // Open side cart
@@ -166,6 +245,7 @@ class CartManager {
                     ${item.color ? `<span class="variant">Color: ${item.color}</span>` : ''}
                   </div>
                   <div class="cart-item-price">₹${item.price.toFixed(2)}</div>
+                  ${this.lineWarning(item) ? `<div class="cart-item-warning">${this.lineWarning(item)}</div>` : ''}
                   <div class="cart-item-quantity">
                     <button class="quantity-btn" onclick="cartManager.updateQuantity(${index}, ${item.quantity - 1})">-</button>
                     <span class="quantity">${item.quantity}</span>
@@ -226,12 +306,32 @@ class CartManager {
   }
 
   // Checkout function
-  checkout() {
+  async checkout() {
     if (this.cart.length === 0) {
       this.showNotification('Your cart is empty', 'error');
       return;
     }
     
+    // Re-check every line's price and stock in one request before going on
+    try {
+      const response = await fetch('/api/v1/cart/validate', {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(this.cartPayload())
+      });
+      if (response.ok) {
+        const result = (await response.json()).cart;
+        this.applyServerCart(result);
+        if (!result.valid) {
+          this.showNotification('Some items in your cart need attention', 'error');
+          return;
+        }
+      }
+    } catch (error) {
+      console.log('Cart validation unavailable:', error);
+    }
+    
     // Redirect to checkout page or show checkout modal
     this.showNotification('Proceeding to checkout...', 'info');
     // You can implement checkout logic here
@@ -0,0 +1,39 @@
+import pytest
+
+from app import create_app, init_db
+from services import auth
+
+
+@pytest.fixture
+def app():
+    """The app on a freshly seeded in-memory database, writing nothing under instance/"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'PAGE_CACHE_ENABLED': False,
+        'CATALOG_CACHE_ENABLED': False,
+        'CATALOG_VERSION_FILE': '',
+        'METRICS_DIR': '',
+        'JINJA_BYTECODE_CACHE_DIR': ''
+    })
+    init_db(app)
+    # The user cache is per process; ids repeat across the tests' fresh databases
+    auth._user_cache = None
+    auth._generations.clear()
+    return app
+
+
+def login(app, username, password):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': password})
+    return client
+
+
+@pytest.fixture
+def user_client(app):
+    return login(app, 'user', 'user123')
+
+
+@pytest.fixture
+def admin_client(app):
+    return login(app, 'admin', 'admin123')
@@ -0,0 +1,23 @@
+from sqlalchemy import delete, update
+
+from models import db, User
+
+
+def change_admin(app, statement):
+    """Change the admin row behind the app's back, as a script or SQL console would"""
+    with app.app_context():
+        db.session.execute(statement)
+        db.session.commit()
+
+
+def test_demoted_admin_loses_access_immediately(app, admin_client):
+    assert admin_client.get('/admin/').status_code == 200
+    change_admin(app, update(User).where(User.username == 'admin').values(is_admin=False))
+    assert admin_client.get('/admin/').status_code == 302
+    assert admin_client.put('/api/v1/orders/1/status', json={'status': 'shipped'}).status_code == 403
+
+
+def test_deleted_admin_loses_access_immediately(app, admin_client):
+    assert admin_client.get('/admin/').status_code == 200
+    change_admin(app, delete(User).where(User.username == 'admin'))
+    assert admin_client.get('/admin/').status_code == 302
@@ -0,0 +1,46 @@
+import pytest
+
+ADDRESS = '221B Baker Street'
+
+
+def place_order(client, **fields):
+    payload = {'items': [{'product_id': 1, 'quantity': 1, 'size': 'M', 'color': 'Black'}],
+               'shipping_address': ADDRESS}
+    payload.update(fields)
+    return client.post('/api/orders', json=payload)
+
+
+def test_order_page_renders_an_api_order(user_client):
+    response = place_order(user_client, payment_method='cod')
+    assert response.status_code == 201
+    order_id = response.get_json()['order']['id']
+    assert user_client.get(f'/order/{order_id}').status_code == 200
+
+
+@pytest.mark.parametrize('payment_method', [None, '', '   '])
+def test_payment_method_is_required(user_client, payment_method):
+    fields = {} if payment_method is None else {'payment_method': payment_method}
+    response = place_order(user_client, **fields)
+    assert response.status_code == 400
+    assert 'payment_method' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('item', [
+    {'product_id': 1, 'quantity': True},
+    {'product_id': 1, 'quantity': 1.9},
+    {'product_id': 1, 'quantity': '3'},
+    {'product_id': '1', 'quantity': 1},
+    {'product_id': True, 'quantity': 1},
+    {'product_id': None, 'quantity': 1},
+])
+def test_line_items_must_be_integers(user_client, item):
+    response = place_order(user_client, payment_method='cod', items=[item])
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Item 0 has an invalid product_id or quantity'
+
+
+@pytest.mark.parametrize('body', [['shipped'], 'shipped', 3, None])
+def test_status_update_needs_a_json_object(admin_client, body):
+    response = admin_client.put('/api/v1/orders/1/status', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Request body must be a JSON object'
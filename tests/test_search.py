@@ -0,0 +1,17 @@
+import warnings
+
+import pytest
+
+
+@pytest.mark.parametrize('url', ['/search?q=%25%25%25', '/search?q=-', '/shop?search=-'])
+def test_search_without_terms_finds_nothing_without_a_cartesian_product(app, url):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        response = app.test_client().get(url)
+    assert response.status_code == 200
+
+
+def test_search_ranks_matches(app):
+    response = app.test_client().get('/search?q=shirt')
+    assert response.status_code == 200
+    assert b'Shirt' in response.data
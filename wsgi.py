@@ -0,0 +1,21 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Builds the app from the environment (see `create_app()`), applies pending
+migrations and, unless ZEECLOTHS_WARM_UP=false, compiles the templates and
+primes the caches. With gunicorn's `preload_app` this runs once in the
+master process and the workers are forked from the warmed-up app. Sample
+data is never added here; run `flask --app app seed` for that.
+"""
+from app import create_app, upgrade_db
+from services.warmup import warm_up
+
+app = create_app()
+
+if app.config['DB_UPGRADE_ON_START']:
+    upgrade_db(app)
+
+if app.config['WARM_UP']:
+    warm_up(app)